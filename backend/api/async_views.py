@@ -0,0 +1,364 @@
+"""Асинхронные представления для чтения (SERVER_MODE=asgi).
+
+GET-запросы тегов, ингредиентов, коротких ссылок, списка и страницы
+рецепта обслуживаются без отдельного потока на запрос: ORM и кеш
+вызываются через асинхронный API Django, поэтому один воркер uvicorn
+держит тысячи соединений. Ответы совпадают с ответами вьюсетов
+api.views: классы аутентификации, рендерер и обработчик исключений
+берутся из настроек REST_FRAMEWORK. Запросы, которым нужен ответ
+не в JSON, остальные методы тех же адресов и запросы с суффиксом
+формата передаются исходным представлениям.
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect
+from django.utils.translation import gettext_lazy as _
+from django_filters.utils import translate_validation
+from rest_framework import exceptions
+from rest_framework.authentication import (TokenAuthentication,
+                                           get_authorization_header)
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.cache import aget_generation, get_response_key, mark_cached
+from api.filters import RecipeFilter
+from api.fragments import aget_recipe_fragments, personalize
+from api.ingredient_index import ingredient_index
+from api.pagination import RecipePagination
+from api.serializers import IngredientSerializer, TagSerializer
+from api.views import RECIPE_LIST_CACHE_PARAMS
+from food import short_links
+from food.models import Ingredient, Recipe, Tag
+
+
+class AsyncTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication с асинхронным чтением токена."""
+
+    async def aauthenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(
+                _("Invalid token header. No credentials provided."))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_(
+                "Invalid token header. "
+                "Token string should not contain spaces."))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_(
+                "Invalid token header. "
+                "Token string should not contain invalid characters."))
+
+        token = await self.get_model().objects.select_related(
+            "user").filter(key=key).afirst()
+        if token is None:
+            raise exceptions.AuthenticationFailed(_("Invalid token."))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _("User inactive or deleted."))
+        return token.user, token
+
+
+# Асинхронные варианты классов DEFAULT_AUTHENTICATION_CLASSES.
+ASYNC_AUTHENTICATION = {TokenAuthentication: AsyncTokenAuthentication}
+
+
+def get_authenticators():
+    return [
+        ASYNC_AUTHENTICATION.get(authentication, authentication)()
+        for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ]
+
+
+async def authenticate_request(request):
+    """Request._authenticate DRF: пользователя определяет первый
+    подошедший класс аутентификации. Классы без aauthenticate
+    (например, SessionAuthentication) вызываются в потоке."""
+    for authenticator in request.authenticators:
+        if hasattr(authenticator, "aauthenticate"):
+            user_auth = await authenticator.aauthenticate(request)
+        else:
+            user_auth = await sync_to_async(authenticator.authenticate)(
+                request)
+        if user_auth is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth
+            return
+    request._not_authenticated()
+
+
+def negotiate(request, json_only=True):
+    """Выбирает рендерер, как APIView.perform_content_negotiation.
+    Возвращает False, если ответ нужен не в JSON (Browsable API) или
+    формат не поддерживается: такой запрос обслуживает исходное
+    представление. С json_only=False в этом случае выбирается
+    JSONRenderer."""
+    renderers = [
+        renderer() for renderer in api_settings.DEFAULT_RENDERER_CLASSES]
+    negotiator = api_settings.DEFAULT_CONTENT_NEGOTIATION_CLASS()
+    try:
+        renderer, media_type = negotiator.select_renderer(request, renderers)
+    except exceptions.NotAcceptable:
+        renderer = None
+    if not isinstance(renderer, JSONRenderer):
+        if json_only:
+            return False
+        renderer = JSONRenderer()
+        media_type = renderer.media_type
+    request.accepted_renderer = renderer
+    request.accepted_media_type = media_type
+    return True
+
+
+def render(request, data, status=200, headers=None):
+    """Ответ, как у Response DRF, но отрисованный сразу: отложенную
+    отрисовку Django выполнял бы в потоке."""
+    renderer = request.accepted_renderer
+    content_type = request.accepted_media_type
+    if renderer.charset:
+        content_type = f"{content_type}; charset={renderer.charset}"
+    response = HttpResponse(
+        renderer.render(
+            data, request.accepted_media_type, {"request": request}),
+        status=status, content_type=content_type, headers=headers)
+    # Для показателей instrumentation, как у Response DRF.
+    response.data = data
+    return response
+
+
+def handle_exception(request, error, args, kwargs):
+    """APIView.handle_exception: ответ обработчика EXCEPTION_HANDLER."""
+    if isinstance(error, (exceptions.AuthenticationFailed,
+                          exceptions.NotAuthenticated)):
+        header = (
+            request.authenticators[0].authenticate_header(request)
+            if request.authenticators else None)
+        if header:
+            error.auth_header = header
+        else:
+            error.status_code = 403
+    context = {"view": None, "args": args, "kwargs": kwargs,
+               "request": request}
+    response = api_settings.EXCEPTION_HANDLER(error, context)
+    if response is None:
+        raise error
+    headers = {
+        name: value for name, value in response.items()
+        if name.lower() != "content-type"
+    }
+    return render(request, response.data, response.status_code, headers)
+
+
+def async_api_view(action, authenticate=True, redirects=False):
+    """Определяет пользователя Request DRF, подготовленного read_async,
+    и превращает исключения в ответы обработчиком DRF. action — имя
+    действия для показателей запроса, как у вьюсета; redirects —
+    представление отвечает перенаправлением, а ошибки отдаёт в JSON
+    при любом Accept."""
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                await authenticate_request(request)
+                response = await view(request, *args, **kwargs)
+            except Exception as error:
+                response = handle_exception(request, error, args, kwargs)
+            response.action = action
+            return response
+        wrapper.authenticate = authenticate
+        wrapper.redirects = redirects
+        return wrapper
+    return decorator
+
+
+async def cached_for_anonymous(request, scope, build, query_params=()):
+    """Ответ с данными build(); для анонимов — из кеша ответов, как
+    у api.cache.cache_anonymous_response."""
+    if request.user.is_authenticated:
+        return render(request, await build())
+    key = get_response_key(
+        request, scope, await aget_generation(scope), query_params)
+    data = await cache.aget(key)
+    if data is not None:
+        mark_cached()
+        return render(request, data)
+    data = await build()
+    await cache.aset(key, data, settings.RESPONSE_CACHE_TIMEOUT)
+    return render(request, data)
+
+
+async def aget_object(queryset, pk):
+    """Объект по pk или Http404, как get_object_or_404 DRF."""
+    try:
+        return await queryset.aget(pk=pk)
+    except queryset.model.DoesNotExist:
+        raise Http404(
+            f"No {queryset.model._meta.object_name} matches the given query.")
+    except (TypeError, ValueError, DjangoValidationError):
+        raise Http404
+
+
+@async_api_view("list")
+async def tag_list(request):
+    async def build():
+        return TagSerializer(
+            [tag async for tag in Tag.objects.all()], many=True).data
+    return await cached_for_anonymous(request, "tags", build)
+
+
+@async_api_view("retrieve")
+async def tag_detail(request, pk):
+    async def build():
+        return TagSerializer(await aget_object(Tag.objects.all(), pk)).data
+    return await cached_for_anonymous(request, "tags", build)
+
+
+@async_api_view("list")
+async def ingredient_list(request):
+    async def build():
+        params = request.query_params
+        limit = params.get("limit")
+        return await ingredient_index.asearch(
+            params.get("name", ""),
+            limit=int(limit) if limit and limit.isdigit() else None,
+            contains=params.get("contains", "").lower() in ("1", "true"),
+        )
+    return await cached_for_anonymous(
+        request, "ingredients", build,
+        query_params=("name", "limit", "contains"))
+
+
+@async_api_view("retrieve")
+async def ingredient_detail(request, pk):
+    async def build():
+        return IngredientSerializer(
+            await aget_object(Ingredient.objects.all(), pk)).data
+    return await cached_for_anonymous(request, "ingredients", build)
+
+
+def filter_recipes(request):
+    """Рецепты по фильтрам запроса. django-filter синхронный, а варианты
+    фильтра тегов читают карту тегов из кеша, поэтому функция
+    вызывается в потоке; сами рецепты она не загружает."""
+    filterset = RecipeFilter(
+        request.query_params, queryset=Recipe.objects.all(), request=request)
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    return filterset.qs
+
+
+async def get_user_flags(user, recipes):
+    """RecipeViewSet._get_user_flags на асинхронном ORM."""
+    if not user.is_authenticated:
+        return {
+            "favorited_ids": set(),
+            "in_shopping_cart_ids": set(),
+            "subscribed_author_ids": set(),
+        }
+    recipe_ids = [recipe.id for recipe in recipes]
+    author_ids = {recipe.author_id for recipe in recipes}
+    return {
+        "favorited_ids": {
+            recipe_id async for recipe_id in user.favorites.filter(
+                recipe_id__in=recipe_ids).values_list("recipe_id", flat=True)
+        },
+        "in_shopping_cart_ids": {
+            recipe_id async for recipe_id in user.shopping_user.filter(
+                recipe_id__in=recipe_ids).values_list("recipe_id", flat=True)
+        },
+        "subscribed_author_ids": {
+            author_id async for author_id in user.following.filter(
+                following_id__in=author_ids).values_list(
+                    "following_id", flat=True)
+        },
+    }
+
+
+async def get_recipes_data(recipes, request):
+    flags = await get_user_flags(request.user, recipes)
+    return [
+        personalize(fragment, **flags)
+        for fragment in await aget_recipe_fragments(recipes, request)
+    ]
+
+
+@async_api_view("list")
+async def recipe_list(request):
+    async def build():
+        queryset = await sync_to_async(filter_recipes)(request)
+        pagination = RecipePagination()
+        recipes = await pagination.apaginate_queryset(queryset, request)
+        data = await get_recipes_data(recipes, request)
+        return pagination.get_paginated_response(data).data
+    return await cached_for_anonymous(
+        request, "recipes", build, query_params=RECIPE_LIST_CACHE_PARAMS)
+
+
+@async_api_view("retrieve")
+async def recipe_detail(request, pk):
+    async def build():
+        recipe = await aget_object(Recipe.objects.all(), pk)
+        data = await get_recipes_data([recipe], request)
+        if not data:
+            # Рецепт удалили после выборки.
+            raise Http404
+        return data[0]
+    return await cached_for_anonymous(request, "recipes", build)
+
+
+@async_api_view("", authenticate=False, redirects=True)
+async def recipe_short_link(request, hash):
+    recipe_id = await short_links.aresolve(hash)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f"/recipes/{recipe_id}/")
+
+
+# Асинхронные представления по именам маршрутов api.urls.
+ASYNC_VIEWS = {
+    "tags-list": tag_list,
+    "tags-detail": tag_detail,
+    "ingredients-list": ingredient_list,
+    "ingredients-detail": ingredient_detail,
+    "recipes-list": recipe_list,
+    "recipes-detail": recipe_detail,
+    "recipe_short_link": recipe_short_link,
+}
+
+
+def read_async(async_view, view):
+    """GET без суффикса формата с ответом в JSON — async_view,
+    остальное — view."""
+    sync_view = sync_to_async(view)
+
+    async def dispatch(request, *args, **kwargs):
+        if request.method == "GET" and kwargs.get("format") is None:
+            drf_request = Request(
+                request, authenticators=(
+                    get_authenticators() if async_view.authenticate
+                    else ()))
+            if negotiate(drf_request, json_only=not async_view.redirects):
+                return await async_view(drf_request, *args, **kwargs)
+        return await sync_view(request, *args, **kwargs)
+
+    # Как у представлений DRF: проверку CSRF делает аутентификация.
+    dispatch.csrf_exempt = True
+    return dispatch
+
+
+def use_async_views(patterns):
+    """Подменяет представления маршрутов из ASYNC_VIEWS."""
+    for pattern in patterns:
+        if getattr(pattern, "name", None) in ASYNC_VIEWS:
+            pattern.callback = read_async(
+                ASYNC_VIEWS[pattern.name], pattern.callback)
@@ -0,0 +1,101 @@
+"""Кеш ответов для анонимных запросов на чтение.
+
+Ключ ответа строится из хоста, пути и нормализованных параметров запроса
+и содержит номер поколения своей области (recipes, tags, ingredients).
+Изменение моделей увеличивает поколение, и старые ответы перестают
+находиться, а затем вытесняются по таймауту.
+"""
+
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+from instrumentation.stats import get_current
+
+GENERATION_KEY = "response_cache:generation:{scope}"
+RESPONSE_KEY = "response_cache:{scope}:{generation}:{host}{path}?{query}"
+
+
+def get_generation(scope):
+    """Текущее поколение области кеша."""
+    return cache.get_or_set(
+        GENERATION_KEY.format(scope=scope), time.time_ns, None)
+
+
+async def aget_generation(scope):
+    """get_generation для асинхронных представлений."""
+    return await cache.aget_or_set(
+        GENERATION_KEY.format(scope=scope), time.time_ns, None)
+
+
+def _bump(scopes):
+    for scope in scopes:
+        try:
+            cache.incr(GENERATION_KEY.format(scope=scope))
+        except ValueError:
+            cache.set(GENERATION_KEY.format(scope=scope), time.time_ns(), None)
+
+
+def invalidate(*scopes):
+    """Сбрасывает кеш областей после фиксации текущей транзакции, чтобы
+    параллельный запрос не закешировал данные до коммита."""
+    transaction.on_commit(lambda: _bump(scopes))
+
+
+def normalize_query(query_params, names):
+    """Строка из значимых параметров запроса в порядке, не зависящем
+    от порядка в URL."""
+    return "&".join(
+        f"{name}={','.join(sorted(query_params.getlist(name)))}"
+        for name in sorted(names)
+        if name in query_params
+    )
+
+
+def get_response_key(request, scope, generation, query_params=()):
+    return RESPONSE_KEY.format(
+        scope=scope,
+        generation=generation,
+        host=request.get_host(),
+        path=request.path,
+        query=normalize_query(request.GET, query_params),
+    )
+
+
+def mark_cached():
+    """Отмечает в показателях запроса, что ответ взят из кеша."""
+    stats = get_current()
+    if stats is not None:
+        stats.cached = True
+
+
+def cache_anonymous_response(scope, query_params=()):
+    """Кеширует успешные ответы анонимным пользователям.
+
+    Ответы авторизованным пользователям содержат персональные флаги
+    и не кешируются.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.user.is_authenticated:
+                return method(self, request, *args, **kwargs)
+
+            key = get_response_key(
+                request, scope, get_generation(scope), query_params)
+            data = cache.get(key)
+            if data is not None:
+                mark_cached()
+                return Response(data)
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+            return response
+        return wrapper
+    return decorator
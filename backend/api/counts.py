@@ -0,0 +1,142 @@
+"""Количество объектов для пагинации.
+
+Точный COUNT(*) по отфильтрованной ленте соединяет рецепты с тегами,
+избранным и корзиной и бывает дороже выборки самой страницы. Поэтому
+количество кешируется по тексту запроса в пределах поколения COUNTS,
+которое сбрасывается при записи рецептов и при появлении и удалении
+пользователей. Количества выборок по избранному, корзине или подпискам
+пользователя кешируются ещё и в пределах его собственного поколения
+(get_user_scope): запись одного пользователя сбрасывает только их.
+На PostgreSQL, если планировщик ожидает не меньше
+PAGINATION_COUNT_ESTIMATE_THRESHOLD строк, вместо точного подсчёта
+отдаётся его оценка.
+"""
+
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+from api.cache import aget_generation, get_generation
+
+COUNTS = "counts"
+COUNT_KEY = "count:{generation}:{digest}"
+
+
+def estimate_count(queryset):
+    """Оценка количества строк планировщиком PostgreSQL.
+
+    Для запроса без условий берётся reltuples таблицы, иначе число строк
+    из EXPLAIN. На других СУБД и для ни разу не анализированной таблицы
+    возвращает None.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    query = queryset.query
+    with connection.cursor() as cursor:
+        if not query.has_filters() and not query.distinct:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class "
+                "WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+            if row is None or row[0] < 0:
+                return None
+            return row[0]
+        sql, params = query.sql_with_params()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+def count_queryset(queryset):
+    """Оценка для больших выборок, точный COUNT(*) для остальных."""
+    threshold = settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+    if threshold:
+        estimate = estimate_count(queryset)
+        if estimate is not None and estimate >= threshold:
+            return estimate
+    return queryset.count()
+
+
+def get_user_scope(user_id):
+    """Область кеша количеств, зависящих от связей пользователя."""
+    return f"{COUNTS}:user:{user_id}"
+
+
+def _get_digest(queryset):
+    """Хеш текста запроса или None для заведомо пустой выборки."""
+    try:
+        sql, params = queryset.query.sql_with_params()
+    except EmptyResultSet:
+        return None
+    return hashlib.md5(
+        repr((queryset.db, sql, params)).encode(),
+        usedforsecurity=False).hexdigest()
+
+
+def get_count(queryset, user_id=None):
+    """Количество объектов выборки из кеша или count_queryset. user_id —
+    пользователь, от избранного, корзины или подписок которого зависит
+    выборка."""
+    queryset = queryset.order_by()
+    digest = _get_digest(queryset)
+    if digest is None:
+        return 0
+    generation = get_generation(COUNTS)
+    if user_id is not None:
+        generation = f"{generation}.{get_generation(get_user_scope(user_id))}"
+    key = COUNT_KEY.format(generation=generation, digest=digest)
+    count = cache.get(key)
+    if count is None:
+        count = count_queryset(queryset)
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+async def aget_count(queryset, user_id=None):
+    """get_count для асинхронных представлений. Оценка планировщика
+    нужна только на PostgreSQL и выполняется в потоке."""
+    queryset = queryset.order_by()
+    digest = _get_digest(queryset)
+    if digest is None:
+        return 0
+    generation = await aget_generation(COUNTS)
+    if user_id is not None:
+        user_generation = await aget_generation(get_user_scope(user_id))
+        generation = f"{generation}.{user_generation}"
+    key = COUNT_KEY.format(generation=generation, digest=digest)
+    count = await cache.aget(key)
+    if count is None:
+        if (settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD
+                and connections[queryset.db].vendor == "postgresql"):
+            count = await sync_to_async(count_queryset)(queryset)
+        else:
+            count = await queryset.acount()
+        await cache.aset(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, считающий QuerySet через get_count."""
+
+    def __init__(self, *args, user_id=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user_id = user_id
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return get_count(self.object_list, self.user_id)
+        return Paginator.count.func(self)
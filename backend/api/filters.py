@@ -1,26 +1,85 @@
+import threading
+
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from rest_framework import filters as drf_filters
 
+from api.cache import get_generation
 from food.models import Recipe, Tag
 
 
-class NameFilter(drf_filters.SearchFilter):
-    search_param = "name"
+class TagSlugMap:
+    """Соответствие слагов тегов их id в памяти процесса.
+
+    Тегов немного и меняются они редко, поэтому карта перечитывается
+    только при смене поколения кеша "tags", которое сбрасывают сигналы
+    тегов.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = (None, {})
+
+    def get(self):
+        generation = get_generation("tags")
+        snapshot = self._snapshot
+        if snapshot[0] != generation:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot[0] != generation:
+                    snapshot = self._snapshot = (
+                        generation,
+                        dict(Tag.objects.values_list("slug", "id")))
+        return snapshot[1]
+
+    def get_ids(self, slugs):
+        """id тегов по слагам, уже проверенным по карте из get().
+        Поколение повторно не проверяется."""
+        slug_ids = self._snapshot[1]
+        return [slug_ids[slug] for slug in slugs if slug in slug_ids]
+
+
+tag_slugs = TagSlugMap()
+
+POPULAR_ORDERING = ("-favorites_count", "-in_carts_count", "-pub_date", "-id")
+
+
+def get_tag_choices():
+    # Функция, а не метод tag_slugs: фильтры копируются через deepcopy.
+    return [(slug, slug) for slug in tag_slugs.get()]
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name="tags__slug",
-        to_field_name="slug",
+    tags = filters.MultipleChoiceFilter(
+        choices=get_tag_choices,
+        method="filter_tags",
     )
     is_favorited = filters.BooleanFilter(method="get_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_in_shopping_cart")
+    ordering = filters.ChoiceFilter(
+        choices=(("popular", "По популярности"),),
+        method="filter_ordering",
+    )
 
     class Meta:
         model = Recipe
-        fields = ["tags", "author", "is_favorited", "is_in_shopping_cart"]
+        fields = ["tags", "author", "is_favorited", "is_in_shopping_cart",
+                  "ordering"]
+
+    def filter_tags(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов. EXISTS вместо соединения
+        с тегами не размножает строки и не требует DISTINCT."""
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe_id=OuterRef("pk"),
+                tag_id__in=tag_slugs.get_ids(value),
+            )
+        ))
+
+    def filter_ordering(self, queryset, name, value):
+        """Сначала рецепты, которые чаще добавляют в избранное и корзину.
+        Порядок совпадает с индексом recipe_popular_idx."""
+        return queryset.order_by(*POPULAR_ORDERING)
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_authenticated and value:
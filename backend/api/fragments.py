@@ -0,0 +1,119 @@
+"""Кеш сериализованных рецептов.
+
+В кеше хранится часть RecipeDetailSerializer, одинаковая для всех
+пользователей. Флаги is_favorited, is_in_shopping_cart и подписка на автора
+подставляются при каждом ответе. Ключ содержит updated_at рецепта, поэтому
+правка рецепта сама делает старый фрагмент недостижимым; изменения тегов,
+ингредиентов справочника и профилей авторов сбрасывают поколение
+RECIPE_FRAGMENTS целиком.
+"""
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Prefetch, Value
+
+from api.cache import aget_generation, get_generation
+from api.serializers import RecipeDetailSerializer
+from food.models import Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+RECIPE_FRAGMENTS = "recipe_fragments"
+FRAGMENT_KEY = "recipe_fragment:{generation}:{host}:{id}:{version}"
+
+
+def get_fragment_queryset():
+    """Рецепты с автором, тегами и ингредиентами, загруженными пачкой
+    запросов независимо от их количества."""
+    return Recipe.objects.prefetch_related(
+        Prefetch(
+            "author",
+            queryset=User.objects.annotate(is_subscribed=Value(False))),
+        Prefetch("tags", queryset=Tag.objects.all()),
+        Prefetch(
+            "recipeingredients",
+            queryset=RecipeIngredient.objects.select_related("ingredient")),
+    )
+
+
+def _get_keys(recipes, request, generation):
+    host = request.get_host()
+    return {
+        recipe.id: FRAGMENT_KEY.format(
+            generation=generation,
+            host=host,
+            id=recipe.id,
+            version=recipe.updated_at.timestamp(),
+        )
+        for recipe in recipes
+    }
+
+
+def _serialize(keys, recipe_ids, request):
+    context = {
+        "request": request,
+        "favorited_ids": set(),
+        "in_shopping_cart_ids": set(),
+    }
+    return {
+        keys[recipe.id]: RecipeDetailSerializer(recipe, context=context).data
+        for recipe in get_fragment_queryset().filter(id__in=recipe_ids)
+    }
+
+
+def _in_order(recipes, keys, fragments):
+    return [
+        fragments[keys[recipe.id]] for recipe in recipes
+        if keys[recipe.id] in fragments
+    ]
+
+
+def get_recipe_fragments(recipes, request):
+    """Фрагменты рецептов в порядке recipes: из кеша одним get_many,
+    недостающие сериализуются и сохраняются одним set_many."""
+    keys = _get_keys(recipes, request, get_generation(RECIPE_FRAGMENTS))
+    fragments = cache.get_many(keys.values())
+
+    missing = [
+        recipe_id for recipe_id, key in keys.items() if key not in fragments
+    ]
+    if missing:
+        fresh = _serialize(keys, missing, request)
+        cache.set_many(fresh, settings.RECIPE_FRAGMENT_TIMEOUT)
+        fragments.update(fresh)
+    return _in_order(recipes, keys, fragments)
+
+
+async def aget_recipe_fragments(recipes, request):
+    """get_recipe_fragments для асинхронных представлений.
+
+    prefetch_related не работает с асинхронным ORM Django 4.2, поэтому
+    недостающие фрагменты сериализуются в потоке.
+    """
+    keys = _get_keys(
+        recipes, request, await aget_generation(RECIPE_FRAGMENTS))
+    fragments = await cache.aget_many(keys.values())
+
+    missing = [
+        recipe_id for recipe_id, key in keys.items() if key not in fragments
+    ]
+    if missing:
+        fresh = await sync_to_async(_serialize)(keys, missing, request)
+        await cache.aset_many(fresh, settings.RECIPE_FRAGMENT_TIMEOUT)
+        fragments.update(fresh)
+    return _in_order(recipes, keys, fragments)
+
+
+def personalize(fragment, favorited_ids, in_shopping_cart_ids,
+                subscribed_author_ids):
+    """Копия фрагмента с флагами текущего пользователя."""
+    data = dict(fragment)
+    data["author"] = {
+        **fragment["author"],
+        "is_subscribed": fragment["author"]["id"] in subscribed_author_ids,
+    }
+    data["is_favorited"] = fragment["id"] in favorited_ids
+    data["is_in_shopping_cart"] = fragment["id"] in in_shopping_cart_ids
+    return data
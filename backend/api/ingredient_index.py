@@ -0,0 +1,135 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения.
+
+Справочник ингредиентов небольшой и меняется редко, поэтому каждый процесс
+держит его отсортированным по названию в нижнем регистре и ищет префикс
+бинарным поиском. Актуальность проверяется по версии в общем кеше: любое
+изменение ингредиента меняет версию, и процессы перечитывают справочник.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from food.models import Ingredient
+
+VERSION_KEY = "ingredient_index:version"
+TRIGRAM_SIZE = 3
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def invalidate():
+    """Помечает индексы всех процессов устаревшими."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, _new_version(), None)
+
+
+def _trigrams(value):
+    return {
+        value[i:i + TRIGRAM_SIZE]
+        for i in range(len(value) - TRIGRAM_SIZE + 1)
+    }
+
+
+class _Snapshot:
+    """Неизменяемый снимок справочника."""
+
+    def __init__(self, version, items, with_trigrams):
+        self.version = version
+        self.items = sorted(
+            items,
+            key=lambda item: (item["name"].lower(), item["name"], item["id"]))
+        self.keys = [item["name"].lower() for item in self.items]
+        self.trigrams = None
+        if with_trigrams:
+            self.trigrams = {}
+            for position, key in enumerate(self.keys):
+                for trigram in _trigrams(key):
+                    self.trigrams.setdefault(trigram, []).append(position)
+
+    def startswith(self, prefix):
+        start = bisect_left(self.keys, prefix)
+        for position in range(start, len(self.keys)):
+            if not self.keys[position].startswith(prefix):
+                break
+            yield position
+
+    def contains(self, query):
+        if self.trigrams is None or len(query) < TRIGRAM_SIZE:
+            candidates = range(len(self.keys))
+        else:
+            postings = [
+                self.trigrams.get(trigram, ())
+                for trigram in _trigrams(query)
+            ]
+            candidates = sorted(set.intersection(*map(set, postings)))
+        for position in candidates:
+            if query in self.keys[position]:
+                yield position
+
+
+class IngredientIndex:
+    """Поиск ингредиентов по началу и по вхождению названия."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _get_snapshot(self, version=None):
+        if version is None:
+            version = cache.get_or_set(VERSION_KEY, _new_version, None)
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None or self._snapshot.version != version:
+                self._snapshot = _Snapshot(
+                    version,
+                    list(Ingredient.objects.values(
+                        "id", "name", "measurement_unit")),
+                    settings.INGREDIENT_INDEX_TRIGRAMS,
+                )
+            return self._snapshot
+
+    def search(self, name="", limit=None, contains=False):
+        """Ингредиенты, название которых начинается с name. При
+        contains=True после них идут ингредиенты, содержащие name."""
+        return self._search(self._get_snapshot(), name, limit, contains)
+
+    async def asearch(self, name="", limit=None, contains=False):
+        """search для асинхронных представлений. Справочник
+        перечитывается в потоке, только если сменилась версия."""
+        version = await cache.aget_or_set(VERSION_KEY, _new_version, None)
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            snapshot = await sync_to_async(self._get_snapshot)(version)
+        return self._search(snapshot, name, limit, contains)
+
+    def _search(self, snapshot, name, limit, contains):
+        query = name.strip().lower()
+        positions = snapshot.startswith(query)
+        results = []
+        seen = set()
+        for position in positions:
+            if limit is not None and len(results) >= limit:
+                return results
+            results.append(snapshot.items[position])
+            seen.add(position)
+        if contains and query:
+            for position in snapshot.contains(query):
+                if limit is not None and len(results) >= limit:
+                    break
+                if position not in seen:
+                    results.append(snapshot.items[position])
+        return results
+
+
+ingredient_index = IngredientIndex()
@@ -1,11 +1,211 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from functools import partial
+
+from django.core.paginator import InvalidPage
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from api.counts import CachedCountPaginator, aget_count, get_count
+from food import feed
+
+# Фильтры ленты рецептов по связям текущего пользователя.
+USER_FILTER_PARAMS = ("is_favorited", "is_in_shopping_cart")
+
+
+def get_count_user_id(request):
+    """id пользователя, если выборка рецептов отфильтрована по его
+    избранному или корзине: её количество кешируется для него отдельно."""
+    user = request.user
+    if user.is_authenticated and any(
+            param in request.query_params for param in USER_FILTER_PARAMS):
+        return user.id
+    return None
 
 
 class PageLimitPagination(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
     page_size_query_param = "limit"
 
 
+class SubscriptionPagination(PageLimitPagination):
+    """Количество подписок кешируется отдельно для каждого пользователя."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.django_paginator_class = partial(
+            CachedCountPaginator, user_id=request.user.id)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipeKeysetPagination(BasePagination):
+    """Пагинация ленты рецептов по ключу (pub_date, id).
+
+    Следующая страница выбирается условием по последнему рецепту
+    предыдущей, поэтому глубокие страницы стоят столько же, сколько
+    первая. Общее количество берётся из api.counts.get_count.
+    """
+
+    cursor_query_param = "cursor"
+    page_size = 10
+    page_size_query_param = "limit"
+    max_page_size = 100
+    ordering = ("-pub_date", "-id")
+    invalid_cursor_message = "Неверный курсор."
+
+    def paginate_queryset(self, queryset, request, view=None):
+        page = self._get_page_queryset(queryset, request)
+        self.count = get_count(queryset, get_count_user_id(request))
+        return self._get_results(list(page))
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset для асинхронных представлений."""
+        page = self._get_page_queryset(queryset, request)
+        self.count = await aget_count(queryset, get_count_user_id(request))
+        return self._get_results([recipe async for recipe in page])
+
+    def _get_page_queryset(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request)
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(
+                Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=pk))
+        return queryset[:self.page_size + 1]
+
+    def _get_results(self, results):
+        self.has_next = len(results) > self.page_size
+        results = results[:self.page_size]
+        self.last = results[-1] if results else None
+        return results
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk = (
+                urlsafe_b64decode(encoded.encode()).decode().split("|"))
+            pub_date = parse_datetime(pub_date)
+            pk = int(pk)
+        except (BinasciiError, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if pub_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return pub_date, pk
+
+    def encode_cursor(self, recipe):
+        return urlsafe_b64encode(
+            f"{recipe.pub_date.isoformat()}|{recipe.id}".encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.last),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            "count": self.count,
+            "next": self.get_next_link(),
+            "previous": None,
+            "results": data,
+        })
+
+
 class RecipePagination(PageNumberPagination):
+    django_paginator_class = CachedCountPaginator
     page_size = 10  # Количество объектов на странице по умолчанию
     page_size_query_param = "limit"  # Количество объектов на странице
     max_page_size = 100  # Максимальное количество объектов на странице
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self._get_keyset(queryset, request)
+        if self.keyset is not None:
+            return self.keyset.paginate_queryset(queryset, request, view)
+        self.django_paginator_class = partial(
+            CachedCountPaginator, user_id=get_count_user_id(request))
+        return super().paginate_queryset(queryset, request, view)
+
+    async def apaginate_queryset(self, queryset, request):
+        """paginate_queryset для асинхронных представлений: количество
+        и страница читаются асинхронным ORM."""
+        self.keyset = self._get_keyset(queryset, request)
+        if self.keyset is not None:
+            return await self.keyset.apaginate_queryset(queryset, request)
+
+        paginator = self.django_paginator_class(
+            queryset, self.get_page_size(request))
+        # Paginator берёт количество из свойства count, задаём его сами,
+        # чтобы page() не считал его синхронно.
+        paginator.count = await aget_count(
+            queryset, get_count_user_id(request))
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as error:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(error)))
+        self.request = request
+        return [recipe async for recipe in self.page.object_list]
+
+    def _get_keyset(self, queryset, request):
+        # Параметр cursor (в том числе пустой) включает пагинацию по ключу.
+        # Ключ (pub_date, id) подходит только для порядка по умолчанию,
+        # явно отсортированные выборки делятся на страницы по номерам.
+        if (RecipeKeysetPagination.cursor_query_param in request.query_params
+                and not queryset.query.order_by):
+            return RecipeKeysetPagination()
+        return None
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class FeedPagination(RecipeKeysetPagination):
+    """Пагинация ленты подписок по тому же ключу (pub_date, id).
+
+    Ключи страницы выбирает food.feed.get_page, рецепты загружаются
+    из переданной выборки одним запросом. Общее количество не
+    считается: для ленты оно не нужно и дорого обходится.
+    """
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        keys = feed.get_page(
+            request.user, self.decode_cursor(request), self.page_size + 1)
+        self.has_next = len(keys) > self.page_size
+        ids = [pk for _, pk in keys[:self.page_size]]
+        recipes = queryset.in_bulk(ids)
+        results = [recipes[pk] for pk in ids if pk in recipes]
+        self.last = results[-1] if results else None
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self.get_next_link(),
+            "previous": None,
+            "results": data,
+        })
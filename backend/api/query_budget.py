@@ -0,0 +1,102 @@
+"""Бюджеты SQL-запросов для маршрутов API.
+
+Бюджет — наибольшее число запросов на один вызов маршрута при
+выключенном кеше. Списки вызываются со страницами разного размера,
+и число запросов не должно от размера зависеть: если оно растёт,
+сериализатор или фильтр делают запрос на каждую строку (N+1).
+
+Каждый маршрут из api.urls должен быть либо в ROUTE_BUDGETS, либо
+в UNCHECKED_ROUTES, чтобы новые эндпоинты не оставались без бюджета.
+Бюджеты проверяют тесты api.tests и команда check_query_budgets.
+"""
+
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver
+
+PAGE_SIZES = (1, 10, 100)
+
+# Запросы аутентификации по токену сюда не входят: пользователь
+# подставляется через force_authenticate. Количество для пагинации
+# считается точно, без оценки планировщика PostgreSQL.
+ROUTE_BUDGETS = {
+    "api-root": 0,
+    "users-list": 3,
+    "users-detail": 2,
+    "users-me": 1,
+    "users-subscriptions": 3,
+    "users-subscribe": 10,
+    "tags-list": 1,
+    "tags-detail": 1,
+    "ingredients-list": 1,
+    "ingredients-detail": 1,
+    "recipes-list": 10,
+    "recipes-detail": 8,
+    "recipes-feed": 11,
+    "recipes-get-link": 1,
+    "recipes-favorite": 4,
+    "recipes-shopping-cart": 9,
+    "recipes-download-shopping-cart": 2,
+    "recipe_short_link": 1,
+}
+
+# Маршруты djoser для управления учётной записью и загрузка аватара
+# не читают списков и работают с одной записью.
+UNCHECKED_ROUTES = {
+    "users-activation",
+    "users-avatar",
+    "users-resend-activation",
+    "users-reset-password",
+    "users-reset-password-confirm",
+    "users-reset-username",
+    "users-reset-username-confirm",
+    "users-set-password",
+    "users-set-username",
+    "login",
+    "logout",
+}
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Число запросов больше бюджета или растёт с размером страницы."""
+
+
+def get_route_names(patterns):
+    """Имена всех маршрутов из списка urlpatterns."""
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= get_route_names(pattern.url_patterns)
+        elif pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+def get_missing_routes(patterns):
+    """Маршруты, для которых не задан бюджет."""
+    return get_route_names(patterns) - ROUTE_BUDGETS.keys() - UNCHECKED_ROUTES
+
+
+@contextmanager
+def assert_max_queries(limit, label=""):
+    """Контекст, в котором можно выполнить не больше limit запросов."""
+    with CaptureQueriesContext(connection) as context:
+        yield context
+    if len(context) > limit:
+        queries = "\n".join(
+            query["sql"][:200] for query in context.captured_queries)
+        raise QueryBudgetExceeded(
+            f"{label}: {len(context)} запросов при бюджете {limit}\n"
+            f"{queries}")
+
+
+def assert_constant(counts, label=""):
+    """Проверяет, что число запросов одинаково для всех размеров
+    страницы. counts — словарь {размер страницы: число запросов}."""
+    if len(set(counts.values())) > 1:
+        growth = ", ".join(
+            f"{size}: {count}" for size, count in sorted(counts.items()))
+        raise QueryBudgetExceeded(
+            f"{label}: число запросов зависит от размера страницы ({growth})")
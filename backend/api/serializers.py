@@ -1,27 +1,55 @@
-import base64
-
-from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer
 from djoser.serializers import UserSerializer as BaseUserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
+from api.uploads import decode_base64_image
 from api.validators import validate_amount, validate_recipe
+from food import shopping_list
 from food.models import (CookUser, Favorite, Follow, Ingredient, Recipe,
                          RecipeIngredient, ShoppingCart, Tag)
+from instrumentation.serializers import TimedSerializerMixin
 
 
 class Base64ImageField(serializers.ImageField):
     "Модуль с функциями кодирования и декодирования base64"
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
-            ext = format.split("/")[-1]
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
+            # Pillow уже проверил файл в decode_base64_image, а проверка
+            # ImageField скопировала бы его целиком в память.
+            return serializers.FileField.to_internal_value(
+                self, decode_base64_image(data))
 
         return super().to_internal_value(data)
 
 
+def get_rendition_urls(renditions, request=None):
+    """URL уменьшенных копий изображения: {размер: {формат: URL}}."""
+    urls = {}
+    for rendition, files in renditions.get("sizes", {}).items():
+        urls[rendition] = {}
+        for image_format, name in files.items():
+            url = default_storage.url(name)
+            if request is not None:
+                url = request.build_absolute_uri(url)
+            urls[rendition][image_format] = url
+    return urls
+
+
+class ImageRenditionsField(serializers.Field):
+    """Уменьшенные копии изображения. Пока они готовятся, пустой словарь:
+    клиенту стоит показывать исходное изображение."""
+
+    def __init__(self, **kwargs):
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, value):
+        return get_rendition_urls(value, self.context.get("request"))
+
+
 class UserCreateSerializer(BaseUserCreateSerializer):
     first_name = serializers.CharField(required=True, max_length=150)
     last_name = serializers.CharField(required=True, max_length=150)
@@ -31,9 +59,10 @@ class UserCreateSerializer(BaseUserCreateSerializer):
         fields = BaseUserSerializer.Meta.fields
 
 
-class UserSerializer(BaseUserSerializer):
+class UserSerializer(TimedSerializerMixin, BaseUserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False, allow_null=True)
+    avatar_renditions = ImageRenditionsField()
 
     password = serializers.CharField(
         write_only=True,
@@ -45,9 +74,12 @@ class UserSerializer(BaseUserSerializer):
         fields = BaseUserSerializer.Meta.fields + (
             "is_subscribed",
             "avatar",
+            "avatar_renditions",
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         request = self.context.get("request")
         if request and request.user.is_authenticated:
             return obj.followers.filter(user=request.user).exists()
@@ -59,7 +91,7 @@ class UserSerializer(BaseUserSerializer):
         return None
 
 
-class AvatarSerializer(serializers.ModelSerializer):
+class AvatarSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для обновления аватара."""
 
     avatar = Base64ImageField()
@@ -70,7 +102,7 @@ class AvatarSerializer(serializers.ModelSerializer):
         fields = ("avatar",)
 
 
-class TagSerializer(serializers.ModelSerializer):
+class TagSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор тэгов."""
 
     class Meta:
@@ -79,7 +111,7 @@ class TagSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор ингредиентов."""
 
     amount = serializers.IntegerField(
@@ -95,6 +127,28 @@ class IngredientSerializer(serializers.ModelSerializer):
         return validate_amount(value)
 
 
+class IngredientAmountListSerializer(serializers.ListSerializer):
+    """Загружает все ингредиенты рецепта одним запросом."""
+
+    def to_internal_value(self, data):
+        items = super().to_internal_value(data)
+        ingredients = Ingredient.objects.in_bulk(
+            {item["ingredient"] for item in items
+             if item["ingredient"] is not None})
+
+        errors = [
+            {} if item["ingredient"] in ingredients
+            else {"id": ["Ingredient not found."]}
+            for item in items
+        ]
+        if any(errors):
+            raise serializers.ValidationError(errors)
+
+        for item in items:
+            item["ingredient"] = ingredients[item["ingredient"]]
+        return items
+
+
 class IngredientAmountSerializer(serializers.ModelSerializer):
     """Сериализатор для связи рецептов и количества ингредиентов."""
     id = serializers.IntegerField(source="ingredient.id")
@@ -106,17 +160,17 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ["id", "amount", "name", "measurement_unit"]
+        list_serializer_class = IngredientAmountListSerializer
 
     def to_internal_value(self, data):
-        ingredient_id = data.get("id")
-        amount = data.get("amount")
-
+        """Возвращает id ингредиента; сами ингредиенты загружает
+        IngredientAmountListSerializer."""
         try:
-            ingredient = Ingredient.objects.get(id=ingredient_id)
-        except Ingredient.DoesNotExist:
-            raise serializers.ValidationError({"id": "Ingredient not found."})
+            ingredient_id = int(data.get("id"))
+        except (TypeError, ValueError):
+            ingredient_id = None
 
-        return {"ingredient": ingredient, "amount": amount}
+        return {"ingredient": ingredient_id, "amount": data.get("amount")}
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
@@ -145,6 +199,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         validate_recipe(attrs)
         return attrs
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop("ingredients")
         tags_data = validated_data.pop("tags")
@@ -152,10 +207,12 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags_data)
 
-        self._create_and_update_ingredients(recipe, ingredients_data)
+        self._create_and_update_ingredients(
+            recipe, ingredients_data, current={})
 
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         ingredients_data = validated_data.pop("ingredients", None)
         tags_data = validated_data.pop("tags", None)
@@ -172,20 +229,52 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         instance.save()
         return instance
 
-    def _create_and_update_ingredients(self, recipe, ingredients_data):
+    def _create_and_update_ingredients(
+            self, recipe, ingredients_data, current=None):
+        """Приводит ингредиенты рецепта к ingredients_data: добавляет новые,
+        обновляет изменённые и удаляет убранные, по запросу на каждое."""
+        if current is None:
+            current = {
+                recipe_ingredient.ingredient_id: recipe_ingredient
+                for recipe_ingredient in recipe.recipeingredients.all()
+            }
+        old_amounts = {
+            ingredient_id: recipe_ingredient.amount
+            for ingredient_id, recipe_ingredient in current.items()
+        }
+        new_amounts = {
+            ingredient_data["ingredient"].id: int(ingredient_data["amount"])
+            for ingredient_data in ingredients_data
+        }
+
+        to_create = []
+        to_update = []
+        for ingredient_id, amount in new_amounts.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient is None:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount))
+            elif recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                to_update.append(recipe_ingredient)
+        to_delete = [
+            recipe_ingredient.id
+            for ingredient_id, recipe_ingredient in current.items()
+            if ingredient_id not in new_amounts
+        ]
 
-        for ingredient_data in ingredients_data:
-            ingredient = ingredient_data.pop("ingredient")
-            amount = ingredient_data["amount"]
+        if to_create:
+            RecipeIngredient.objects.bulk_create(to_create)
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ["amount"])
+        if to_delete:
+            RecipeIngredient.objects.filter(id__in=to_delete).delete()
 
-            RecipeIngredient.objects.update_or_create(
-                recipe=recipe,
-                ingredient=ingredient,
-                defaults={"amount": amount}
-            )
+        shopping_list.update_recipe(recipe.id, old_amounts, new_amounts)
 
 
-class RecipeDetailSerializer(serializers.ModelSerializer):
+class RecipeDetailSerializer(TimedSerializerMixin,
+                             serializers.ModelSerializer):
     """Сериализатор для деталей рецепта."""
 
     author = UserSerializer(read_only=True)
@@ -195,14 +284,19 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
     is_in_shopping_cart = serializers.SerializerMethodField()
     tags = TagSerializer(many=True)
     image = Base64ImageField(required=False, allow_null=True)
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
         fields = ["id", "tags", "author", "ingredients", "is_favorited",
                   "is_in_shopping_cart",
-                  "name", "image", "text", "cooking_time"]
+                  "name", "image", "image_renditions", "text",
+                  "cooking_time"]
 
     def get_is_favorited(self, obj):
+        favorited_ids = self.context.get("favorited_ids")
+        if favorited_ids is not None:
+            return obj.id in favorited_ids
         request = self.context.get('request')
         user = request.user if request.user.is_authenticated else None
         return user.favorites.filter(recipe=obj).exists() if user else False
@@ -213,6 +307,9 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
         return representation
 
     def get_is_in_shopping_cart(self, obj):
+        in_shopping_cart_ids = self.context.get("in_shopping_cart_ids")
+        if in_shopping_cart_ids is not None:
+            return obj.id in in_shopping_cart_ids
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -220,23 +317,26 @@ class RecipeDetailSerializer(serializers.ModelSerializer):
 
 
 class RecipeMinSerializer(serializers.ModelSerializer):
+    image_renditions = ImageRenditionsField()
 
     class Meta:
         model = Recipe
-        fields = ("id", "name", "image", "cooking_time",)
+        fields = ("id", "name", "image", "image_renditions", "cooking_time",)
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
+class FavoriteSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """Сериализатор для работы с избранными рецептами."""
     name = serializers.CharField(source="recipe.name", read_only=True)
     image = serializers.CharField(source="recipe.image", read_only=True)
+    image_renditions = ImageRenditionsField(
+        source="recipe.image_renditions")
     cooking_time = serializers.IntegerField(
         source="recipe.cooking_time", read_only=True)
 
     class Meta:
         model = Favorite
 
-        fields = ["id", "name", "image", "cooking_time"]
+        fields = ["id", "name", "image", "image_renditions", "cooking_time"]
 
 
 class UserSubscribeSerializer(UserSerializer):
@@ -251,23 +351,28 @@ class UserSubscribeSerializer(UserSerializer):
     class Meta:
         model = CookUser
         fields = ("email", "id", "username", "first_name", "avatar",
-                  "last_name", "is_subscribed", "recipes", "recipes_count")
+                  "avatar_renditions", "last_name", "is_subscribed",
+                  "recipes", "recipes_count")
         read_only_fields = (
             "email", "avatar", "username", "first_name", "last_name",
             "is_subscribed", "recipes", "recipes_count")
 
     def get_recipes(self, obj):
         request = self.context.get("request")
-        recipes_limit = None
-        if request:
-            recipes_limit = request.query_params.get("recipes_limit")
-        recipes = obj.recipes.all()
-        if recipes_limit:
-            recipes = obj.recipes.all()[:int(recipes_limit)]
+        recipes = getattr(obj, "subscription_recipes", None)
+        if recipes is None:
+            recipes_limit = None
+            if request:
+                recipes_limit = request.query_params.get("recipes_limit")
+            recipes = obj.recipes.all()
+            if recipes_limit:
+                recipes = obj.recipes.all()[:int(recipes_limit)]
         return RecipeMinSerializer(
             recipes, many=True, context={"request": request}).data
 
     def get_recipes_count(self, obj):
+        if hasattr(obj, "recipes_count"):
+            return obj.recipes_count
         return obj.recipes.count()
 
 
@@ -321,5 +426,7 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
             "id": recipe.id,
             "name": recipe.name,
             "image": recipe.image.url if recipe.image else None,
+            "image_renditions": get_rendition_urls(
+                recipe.image_renditions, self.context.get("request")),
             "cooking_time": recipe.cooking_time
         }
@@ -0,0 +1,62 @@
+"""Потоковая выгрузка списка покупок в разных форматах."""
+
+import csv
+import json
+
+from rest_framework.negotiation import DefaultContentNegotiation
+
+SHOPPING_LIST_TITLE = "Список покупок:\n\n"
+SHOPPING_LIST_FIELDS = ("name", "measurement_unit", "amount")
+
+
+class ShoppingListNegotiation(DefaultContentNegotiation):
+    """Не даёт DRF трактовать ?format=txt|csv как формат рендерера:
+    у выгрузки свой параметр format."""
+
+    def filter_renderers(self, renderers, format):
+        return renderers
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def _rows(ingredients):
+    for ingredient in ingredients:
+        yield (
+            ingredient["ingredient__name"],
+            ingredient["ingredient__measurement_unit"],
+            ingredient["amount"],
+        )
+
+
+def render_txt(ingredients):
+    yield SHOPPING_LIST_TITLE
+    for name, measurement_unit, amount in _rows(ingredients):
+        yield f"{name} ({measurement_unit}) - {amount}\n"
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_LIST_FIELDS)
+    for row in _rows(ingredients):
+        yield writer.writerow(row)
+
+
+def render_json(ingredients):
+    separator = "["
+    for row in _rows(ingredients):
+        yield separator + json.dumps(
+            dict(zip(SHOPPING_LIST_FIELDS, row)), ensure_ascii=False)
+        separator = ","
+    yield "[]" if separator == "[" else "]"
+
+
+SHOPPING_LIST_FORMATS = {
+    "txt": ("text/plain; charset=utf-8", render_txt),
+    "csv": ("text/csv; charset=utf-8", render_csv),
+    "json": ("application/json", render_json),
+}
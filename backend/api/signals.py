@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.cache import invalidate as invalidate_response_cache
+from api.counts import COUNTS, get_user_scope
+from api.fragments import RECIPE_FRAGMENTS
+from api.ingredient_index import invalidate as invalidate_ingredient_index
+from api.warmup import schedule as schedule_cache_warming
+from food.models import (Favorite, Follow, Ingredient, Recipe,
+                         RecipeIngredient, ShoppingCart, Tag)
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    """Сбрасывает индекс и кеш ответов при изменении справочника."""
+    transaction.on_commit(invalidate_ingredient_index)
+    invalidate_response_cache("ingredients", "recipes", RECIPE_FRAGMENTS)
+    transaction.on_commit(schedule_cache_warming)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_changed(sender, **kwargs):
+    """Сбрасывает кеш ленты рецептов и количества в пагинации."""
+    invalidate_response_cache("recipes", COUNTS)
+    transaction.on_commit(schedule_cache_warming)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def relation_changed(sender, instance, **kwargs):
+    """Избранное, корзина и подписки входят только в выборки своего
+    пользователя, поэтому сбрасываются только его количества."""
+    invalidate_response_cache(get_user_scope(instance.user_id))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(sender, **kwargs):
+    """Теги выводятся и в рецептах, поэтому сбрасываются и они."""
+    invalidate_response_cache("tags", "recipes", RECIPE_FRAGMENTS)
+    transaction.on_commit(schedule_cache_warming)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def author_changed(sender, update_fields=None, **kwargs):
+    """Рецепты содержат данные автора. Обновление last_login при входе
+    их не меняет. Количество пользователей меняется, только когда
+    пользователь появляется или удаляется."""
+    if update_fields is not None and set(update_fields) <= {"last_login"}:
+        return
+    scopes = ["recipes", RECIPE_FRAGMENTS]
+    # У post_delete нет аргумента created.
+    if kwargs.get("created", True):
+        scopes.append(COUNTS)
+    invalidate_response_cache(*scopes)
+    transaction.on_commit(schedule_cache_warming)
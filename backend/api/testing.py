@@ -0,0 +1,277 @@
+"""Данные и помощники для проверок SQL-запросов эндпоинтов API:
+их числа и планов.
+
+Используются тестами api.tests и командами check_query_budgets
+и check_query_plans.
+"""
+
+import json
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.async_views import ASYNC_VIEWS, read_async
+from api.query_budget import PAGE_SIZES
+from food import feed, shopping_list, short_links
+from food.models import (Favorite, Follow, Ingredient, Recipe,
+                         RecipeIngredient, ShoppingCart, Tag)
+
+# Узлы, после которых полное чтение таблицы уже не оправдано: выбирается
+# часть строк или таблица соединяется с другой.
+NARROWING_NODES = {"Limit", "Nested Loop", "Hash Join", "Merge Join"}
+
+User = get_user_model()
+
+# Без кеша каждый запрос доходит до базы: фрагменты рецептов,
+# индекс ингредиентов и количество для пагинации.
+NO_CACHE = {
+    "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+
+ROWS = max(PAGE_SIZES)
+RECIPES_PER_AUTHOR = 2
+INGREDIENTS_PER_RECIPE = 3
+
+
+class Fixture:
+    """Данные для проверки: ROWS авторов с рецептами, подписки,
+    избранное и корзина пользователя, у которого всего по ROWS."""
+
+    def __init__(self):
+        password = make_password(None)
+        self.authors = User.objects.bulk_create(
+            User(email=f"budget-{number}@example.com",
+                 username=f"budget-{number}", password=password)
+            for number in range(ROWS + 1)
+        )
+        # Последний автор остаётся без подписки для POST subscribe.
+        *self.authors, self.stranger = self.authors
+        self.user = User.objects.create(
+            email="budget-user@example.com", username="budget-user",
+            password=password)
+        self.tags = Tag.objects.bulk_create(
+            Tag(name=f"budget-tag-{number}", slug=f"budget-tag-{number}")
+            for number in range(3)
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f"budget-ingredient-{number}",
+                       measurement_unit="г")
+            for number in range(ROWS)
+        )
+        self.ingredient = ingredients[0]
+        self.recipes = Recipe.objects.bulk_create(
+            Recipe(author=author, name=f"Рецепт {number}", text="Текст",
+                   cooking_time=10)
+            for author in self.authors
+            for number in range(RECIPES_PER_AUTHOR)
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(index + offset) % ROWS],
+                amount=10)
+            for index, recipe in enumerate(self.recipes)
+            for offset in range(INGREDIENTS_PER_RECIPE)
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in self.recipes for tag in self.tags[:2]
+        )
+        Follow.objects.bulk_create(
+            Follow(user=self.user, following=author)
+            for author in self.authors)
+        Favorite.objects.bulk_create(
+            Favorite(user=self.user, recipe=recipe)
+            for recipe in self.recipes[:ROWS])
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=self.user, recipe=recipe)
+            for recipe in self.recipes[:ROWS])
+        shopping_list.rebuild(self.user.id)
+        feed.rebuild(self.user.id)
+        self.recipe = self.recipes[0]
+        self.free_recipe = self.recipes[-1]
+
+
+def get_budget_calls(fixture):
+    """Вызовы маршрутов для проверки бюджетов: (маршрут, метод, путь,
+    зависит ли от размера страницы).
+
+    {size} в пути заменяется размером страницы.
+    """
+    recipes = reverse("recipes-list")
+    subscriptions = reverse("users-subscriptions")
+    recipe = [fixture.recipe.id]
+    free_recipe = [fixture.free_recipe.id]
+    author = [fixture.authors[0].id]
+    return [
+        ("api-root", "GET", reverse("api-root"), False),
+        ("users-list", "GET", reverse("users-list") + "?limit={size}",
+         True),
+        ("users-detail", "GET", reverse("users-detail", args=author),
+         False),
+        ("users-me", "GET", reverse("users-me"), False),
+        ("users-subscriptions", "GET", subscriptions + "?limit={size}",
+         True),
+        ("users-subscriptions", "GET",
+         subscriptions + f"?limit={ROWS}&recipes_limit={{size}}", True),
+        ("users-subscribe", "POST",
+         reverse("users-subscribe", args=[fixture.stranger.id]), False),
+        ("users-subscribe", "DELETE",
+         reverse("users-subscribe", args=author), False),
+        ("tags-list", "GET", reverse("tags-list"), False),
+        ("tags-detail", "GET",
+         reverse("tags-detail", args=[fixture.tags[0].id]), False),
+        ("ingredients-list", "GET",
+         reverse("ingredients-list") + "?name=budget", False),
+        ("ingredients-detail", "GET",
+         reverse("ingredients-detail", args=[fixture.ingredient.id]),
+         False),
+        ("recipes-list", "GET", recipes + "?limit={size}", True),
+        ("recipes-list", "GET", recipes + "?limit={size}&cursor=", True),
+        ("recipes-list", "GET",
+         recipes + "?limit={size}&is_favorited=1", True),
+        ("recipes-list", "GET",
+         recipes + "?limit={size}&is_in_shopping_cart=1", True),
+        ("recipes-list", "GET",
+         recipes + f"?limit={{size}}&tags={fixture.tags[0].slug}", True),
+        ("recipes-list", "GET", recipes + "?limit={size}&ordering=popular",
+         True),
+        ("recipes-feed", "GET",
+         reverse("recipes-feed") + "?limit={size}", True),
+        ("recipes-feed", "GET",
+         reverse("recipes-feed") + "?limit={size}&cursor=", True),
+        ("recipes-detail", "GET",
+         reverse("recipes-detail", args=recipe), False),
+        ("recipes-get-link", "GET",
+         reverse("recipes-get-link", args=recipe), False),
+        ("recipes-favorite", "POST",
+         reverse("recipes-favorite", args=free_recipe), False),
+        ("recipes-favorite", "DELETE",
+         reverse("recipes-favorite", args=recipe), False),
+        ("recipes-shopping-cart", "POST",
+         reverse("recipes-shopping-cart", args=free_recipe), False),
+        ("recipes-shopping-cart", "DELETE",
+         reverse("recipes-shopping-cart", args=recipe), False),
+        ("recipes-download-shopping-cart", "GET",
+         reverse("recipes-download-shopping-cart"), False),
+        ("recipe_short_link", "GET",
+         reverse("recipe_short_link",
+                 args=[short_links.encode(fixture.recipe.id)]), False),
+    ]
+
+
+def call_view(method, path, user=None, data=None, async_views=False):
+    """Вызывает представление маршрута и возвращает ответ и SQL его
+    запросов. Изменения, сделанные запросом, откатываются.
+
+    async_views — вызывать представления api.async_views, как при
+    SERVER_MODE=asgi, независимо от режима, в котором собраны маршруты.
+    """
+    factory = APIRequestFactory()
+    request = getattr(factory, method.lower())(
+        path, data, format="json", SERVER_NAME=settings.ALLOWED_HOSTS[0])
+    if user is not None:
+        force_authenticate(request, user=user)
+    match = request.resolver_match = resolve(request.path)
+    view = match.func
+    if (async_views and match.url_name in ASYNC_VIEWS
+            and not iscoroutinefunction(view)):
+        view = read_async(ASYNC_VIEWS[match.url_name], view)
+    if iscoroutinefunction(view):
+        view = async_to_sync(view)
+    with transaction.atomic():
+        with CaptureQueriesContext(connection) as context:
+            response = view(request, *match.args, **match.kwargs)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elif hasattr(response, "render"):
+                response.render()
+        transaction.set_rollback(True)
+    # Точки сохранения atomic() — не запросы приложения.
+    queries = [
+        query["sql"] for query in context.captured_queries
+        if "SAVEPOINT" not in query["sql"]
+    ]
+    return response, queries
+
+
+def count_queries(method, path, user=None, data=None, async_views=False):
+    """Код ответа и число запросов представления, см. call_view."""
+    response, queries = call_view(method, path, user, data, async_views)
+    return response.status_code, len(queries)
+
+
+def measure_budget_calls(fixture, async_views=False):
+    """Число запросов вызовов get_budget_calls: (маршрут, метка,
+    {размер страницы: (код ответа, число запросов)})."""
+    for route, method, path, sized in get_budget_calls(fixture):
+        user = None if route == "recipe_short_link" else fixture.user
+        results = {
+            size: count_queries(
+                method, path.format(size=size), user,
+                async_views=async_views)
+            for size in (PAGE_SIZES if sized else (None,))
+        }
+        yield route, f"{method} {path.format(size='N')}", results
+
+
+def get_plan_paths(recipe):
+    """GET-запросы рецептов, ингредиентов и подписок, планы которых
+    проверяются. recipe — рецепт для страницы и фильтров."""
+    recipes = reverse("recipes-list")
+    paths = [
+        recipes,
+        f"{recipes}?cursor=",
+        f"{recipes}?author={recipe.author_id}",
+        f"{recipes}?is_favorited=1",
+        f"{recipes}?is_in_shopping_cart=1",
+        reverse("recipes-detail", args=[recipe.id]),
+        reverse("recipes-download-shopping-cart"),
+        f"{reverse('users-subscriptions')}?recipes_limit=3",
+        reverse("ingredients-list"),
+    ]
+    tag = Tag.objects.filter(recipes=recipe).first()
+    if tag is not None:
+        paths.append(f"{recipes}?tags={tag.slug}")
+    ingredient = Ingredient.objects.first()
+    if ingredient is not None:
+        paths += [
+            f"{reverse('ingredients-list')}?name={ingredient.name[:2]}",
+            reverse("ingredients-detail", args=[ingredient.id]),
+        ]
+    return paths
+
+
+def capture_selects(path, user):
+    """SQL запросов SELECT, выполненных GET-запросом path от имени
+    user, или AssertionError, если запрос завершился ошибкой."""
+    response, queries = call_view("GET", path, user)
+    if response.status_code >= 400:
+        raise AssertionError(f"{path}: ответ {response.status_code}")
+    return [
+        sql for sql in queries if sql.lstrip().upper().startswith("SELECT")]
+
+
+def explain(sql):
+    """План запроса из EXPLAIN (FORMAT JSON), только PostgreSQL."""
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]["Plan"]
+
+
+def find_seq_scans(plan, narrowed=False):
+    """Последовательные чтения таблиц, которые мог бы заменить индекс:
+    с условием Filter или под LIMIT и соединениями."""
+    narrowed = narrowed or plan["Node Type"] in NARROWING_NODES
+    if plan["Node Type"] == "Seq Scan" and (narrowed or "Filter" in plan):
+        yield plan
+    for child in plan.get("Plans", ()):
+        yield from find_seq_scans(child, narrowed)
@@ -0,0 +1,229 @@
+"""Проверки бюджетов запросов, ленты рецептов, асинхронных
+представлений, списка покупок и загрузки изображений."""
+
+import json
+import textwrap
+from base64 import b64encode
+from io import BytesIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.http import HttpResponse
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from api import async_views
+from api import urls as api_urls
+from api.query_budget import (PAGE_SIZES, ROUTE_BUDGETS, assert_constant,
+                              get_missing_routes)
+from api.testing import (NO_CACHE, Fixture, capture_selects, count_queries,
+                         explain, find_seq_scans, get_plan_paths,
+                         measure_budget_calls)
+from api.uploads import decode_base64_image
+from food.models import Favorite, Ingredient, ShoppingCart
+
+
+@override_settings(CACHES=NO_CACHE, PAGINATION_COUNT_ESTIMATE_THRESHOLD=0)
+class QueryBudgetTest(TestCase):
+    """Бюджеты api.query_budget для страниц из PAGE_SIZES строк
+    в синхронном и асинхронном (SERVER_MODE=asgi) режимах."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = Fixture()
+
+    def test_every_route_has_budget(self):
+        self.assertEqual(get_missing_routes(api_urls.urlpatterns), set())
+
+    def check_budgets(self, async_views):
+        for route, label, results in measure_budget_calls(
+                self.fixture, async_views):
+            with self.subTest(label):
+                counts = {
+                    size: count for size, (_, count) in results.items()}
+                for status, _ in results.values():
+                    self.assertLess(status, 400)
+                assert_constant(counts, label)
+                self.assertLessEqual(
+                    max(counts.values()), ROUTE_BUDGETS[route])
+
+    def test_budgets(self):
+        self.check_budgets(async_views=False)
+
+    def test_async_budgets(self):
+        self.check_budgets(async_views=True)
+
+
+@skipUnless(connection.vendor == "postgresql", "EXPLAIN для PostgreSQL")
+@override_settings(CACHES=NO_CACHE)
+class QueryPlanTest(TestCase):
+    """Основные запросы читают таблицы по индексам. На тестовых данных
+    планировщик предпочёл бы полное чтение маленьких таблиц, поэтому
+    оно выключено: Seq Scan остаётся, только если индекса нет."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = Fixture()
+
+    def test_no_seq_scans(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        for path in get_plan_paths(self.fixture.recipe):
+            for sql in capture_selects(path, self.fixture.user):
+                with self.subTest(path=path, sql=sql[:300]):
+                    self.assertEqual([
+                        node["Relation Name"]
+                        for node in find_seq_scans(explain(sql))
+                    ], [])
+
+
+@override_settings(CACHES=NO_CACHE, PAGINATION_COUNT_ESTIMATE_THRESHOLD=0)
+class RecipeListQueriesTest(TestCase):
+    """Кеш отключён, чтобы каждый запрос доходил до базы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = Fixture()
+
+    def get_counts(self, path, user=None):
+        """Число запросов для страниц из PAGE_SIZES рецептов."""
+        counts = {}
+        for size in PAGE_SIZES:
+            status, counts[size] = count_queries(
+                "GET", f"{path}?limit={size}", user)
+            self.assertEqual(status, 200)
+        return counts
+
+    def test_user_flags_do_not_depend_on_page_size(self):
+        counts = self.get_counts("/api/recipes/", self.fixture.user)
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+        client = APIClient()
+        client.force_authenticate(self.fixture.user)
+        results = client.get(
+            f"/api/recipes/?limit={max(PAGE_SIZES)}").json()["results"]
+        favorited = set(Favorite.objects.filter(
+            user=self.fixture.user).values_list("recipe_id", flat=True))
+        in_cart = set(ShoppingCart.objects.filter(
+            user=self.fixture.user).values_list("recipe_id", flat=True))
+        for recipe in results:
+            self.assertEqual(
+                recipe["is_favorited"], recipe["id"] in favorited)
+            self.assertEqual(
+                recipe["is_in_shopping_cart"], recipe["id"] in in_cart)
+
+    def test_list_and_detail_queries_are_bounded(self):
+        """Автор, теги и ингредиенты загружаются пачкой, а не по рецепту."""
+        for user in (None, self.fixture.user):
+            counts = self.get_counts("/api/recipes/", user)
+            self.assertEqual(len(set(counts.values())), 1, counts)
+            self.assertLessEqual(
+                max(counts.values()), ROUTE_BUDGETS["recipes-list"])
+
+            status, queries = count_queries(
+                "GET", f"/api/recipes/{self.fixture.recipe.id}/", user)
+            self.assertEqual(status, 200)
+            self.assertLessEqual(queries, ROUTE_BUDGETS["recipes-detail"])
+
+
+def teapot_exception_handler(exc, context):
+    return Response({"teapot": str(exc)}, status=418)
+
+
+def sync_view(request, *args, **kwargs):
+    return HttpResponse("sync")
+
+
+@override_settings(CACHES=NO_CACHE)
+class AsyncViewsTest(TestCase):
+    """Асинхронные представления следуют настройкам REST_FRAMEWORK."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = Fixture()
+
+    def call(self, pk, user=None, **headers):
+        request = RequestFactory().get(f"/api/recipes/{pk}/", **headers)
+        if user is not None:
+            # Как после AuthenticationMiddleware с сессией.
+            request.user = user
+        view = async_views.read_async(async_views.recipe_detail, sync_view)
+        return async_to_sync(view)(request, pk=str(pk))
+
+    @override_settings(REST_FRAMEWORK={
+        "DEFAULT_AUTHENTICATION_CLASSES": [
+            "rest_framework.authentication.SessionAuthentication",
+            "rest_framework.authentication.TokenAuthentication",
+        ],
+    })
+    def test_configured_authentication(self):
+        response = self.call(self.fixture.recipe.id, user=self.fixture.user)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(json.loads(response.content)["is_favorited"])
+
+    @override_settings(REST_FRAMEWORK={
+        "EXCEPTION_HANDLER": "api.tests.teapot_exception_handler",
+    })
+    def test_configured_exception_handler(self):
+        response = self.call(0)
+        self.assertEqual(response.status_code, 418)
+        self.assertIn("teapot", json.loads(response.content))
+
+    def test_browsable_api_is_served_by_sync_view(self):
+        response = self.call(self.fixture.recipe.id, HTTP_ACCEPT="text/html")
+        self.assertEqual(response.content, b"sync")
+
+
+@override_settings(CACHES=NO_CACHE)
+class ShoppingListETagTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = Fixture()
+
+    def test_etag_changes_with_ingredient_name(self):
+        client = APIClient()
+        client.force_authenticate(self.fixture.user)
+        path = "/api/recipes/download_shopping_cart/"
+        etag = client.get(path)["ETag"]
+        self.assertEqual(
+            client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        ingredient = Ingredient.objects.filter(
+            shopping_list_items__user=self.fixture.user).first()
+        ingredient.name += " молотая"
+        ingredient.save()
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+
+class DecodeBase64ImageTest(SimpleTestCase):
+
+    def setUp(self):
+        buffer = BytesIO()
+        Image.new("RGB", (64, 64), "red").save(buffer, "PNG")
+        self.image = buffer.getvalue()
+        self.encoded = b64encode(self.image).decode()
+
+    def test_whitespace_is_ignored(self):
+        wrapped = "\r\n".join(textwrap.wrap(self.encoded, 76))
+        # Части по 50 символов не кратны 4 и режут переводы строк.
+        with mock.patch("api.uploads.CHUNK_SIZE", 50):
+            file = decode_base64_image(
+                f"data:image/png;base64,\n{wrapped}\n")
+        self.assertEqual(file.read(), self.image)
+
+    def test_truncated_data_is_rejected(self):
+        with self.assertRaises(ValidationError):
+            decode_base64_image(f"data:image/png;base64,{self.encoded}A")
+
+    def test_oversized_data_is_rejected(self):
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=len(self.image) - 1):
+            with self.assertRaises(ValidationError):
+                decode_base64_image(f"data:image/png;base64,{self.encoded}")
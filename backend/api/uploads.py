@@ -0,0 +1,114 @@
+"""Декодирование изображений, присланных строкой data:image/...;base64.
+
+Строка декодируется частями прямо во временный файл, который держится
+в памяти до IMAGE_UPLOAD_SPOOL_SIZE байт и дальше переносится на диск.
+Размер проверяется по длине строки до декодирования и по числу
+декодированных байт, размеры в пикселях
+по заголовку файла до полной проверки Pillow.
+"""
+
+import binascii
+import re
+from base64 import b64decode
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+from rest_framework import serializers
+
+DATA_URL_RE = re.compile(r"data:image/(?P<subtype>[a-z0-9.+-]+);base64,")
+# Переводы строк и пробелы, которые вставляют многие кодировщики base64.
+WHITESPACE_RE = re.compile(r"\s+")
+# Часть строки для одного вызова b64decode, кратна 4.
+CHUNK_SIZE = 64 * 1024
+
+EXTENSIONS = {
+    "png": "png",
+    "jpeg": "jpeg",
+    "jpg": "jpg",
+    "gif": "gif",
+    "webp": "webp",
+}
+
+
+def decode_base64_image(data):
+    """Файл изображения из строки data:image/...;base64,...
+
+    Возвращает UploadedFile поверх SpooledTemporaryFile, уже проверенный
+    Pillow. Пробельные символы внутри base64 отбрасываются. Ошибки
+    оформляются как ValidationError.
+    """
+    match = DATA_URL_RE.match(data)
+    if match is None:
+        raise serializers.ValidationError(
+            "Ожидается изображение в формате data:image/...;base64.")
+    extension = EXTENSIONS.get(match["subtype"])
+    if extension is None:
+        raise serializers.ValidationError(
+            "Неподдерживаемый формат изображения.")
+
+    start = match.end()
+    if len(data) - start > get_max_encoded_size():
+        raise get_size_error()
+
+    file = SpooledTemporaryFile(max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE)
+    try:
+        # Пробелы убираются в каждой части отдельно; остаток меньше
+        # четырёх символов переносится в следующую часть.
+        rest = ""
+        for position in range(start, len(data), CHUNK_SIZE):
+            chunk = rest + WHITESPACE_RE.sub(
+                "", data[position:position + CHUNK_SIZE])
+            usable = len(chunk) - len(chunk) % 4
+            file.write(b64decode(chunk[:usable], validate=True))
+            rest = chunk[usable:]
+            if file.tell() > settings.IMAGE_UPLOAD_MAX_SIZE:
+                raise get_size_error()
+        if rest or not file.tell():
+            raise binascii.Error
+        size = file.tell()
+        file.seek(0)
+        check_image(file)
+    except binascii.Error:
+        file.close()
+        raise serializers.ValidationError("Некорректные данные base64.")
+    except serializers.ValidationError:
+        file.close()
+        raise
+    file.seek(0)
+    return UploadedFile(
+        file,
+        name=f"temp.{extension}",
+        content_type=f"image/{match['subtype']}",
+        size=size,
+    )
+
+
+def get_max_encoded_size():
+    """Длина base64 для IMAGE_UPLOAD_MAX_SIZE байт с переводами строк
+    через каждые 76 символов, как у MIME."""
+    size = (settings.IMAGE_UPLOAD_MAX_SIZE + 2) // 3 * 4
+    return size + size // 76 * 2
+
+
+def get_size_error():
+    return serializers.ValidationError(
+        "Размер изображения не должен превышать "
+        f"{filesizeformat(settings.IMAGE_UPLOAD_MAX_SIZE)}.")
+
+
+def check_image(file):
+    """Проверяет размеры по заголовку, затем целостность файла."""
+    try:
+        # open читает только заголовок, пиксели не декодируются.
+        with Image.open(file) as image:
+            width, height = image.size
+            if width * height > settings.IMAGE_UPLOAD_MAX_PIXELS:
+                raise serializers.ValidationError(
+                    f"Изображение {width}x{height} слишком большое.")
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise serializers.ValidationError(
+            "Загрузите корректное изображение.")
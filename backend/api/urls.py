@@ -3,6 +3,7 @@ from django.conf.urls.static import static
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from api.async_views import use_async_views
 from api.views import (IngredientViewSet, RecipeViewSet, TagViewSet,
                        UserViewSet, recipe_short_link)
 
@@ -12,12 +13,17 @@ v1_router.register("tags", TagViewSet, basename="tags")
 v1_router.register("ingredients", IngredientViewSet, basename="ingredients")
 v1_router.register("recipes", RecipeViewSet, basename="recipes")
 
+router_urls = v1_router.urls
+
 urlpatterns = [
-    path("", include(v1_router.urls)),
+    path("", include(router_urls)),
     path("auth/", include("djoser.urls.authtoken")),
     path("r/<str:hash>/", recipe_short_link, name="recipe_short_link"),
 ]
 
+if settings.ASYNC_READ_VIEWS:
+    use_async_views([*router_urls, *urlpatterns])
+
 
 if settings.DEBUG:
     urlpatterns += static(
@@ -1,18 +1,27 @@
-from io import StringIO
+import hashlib
 
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import Count, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, viewsets
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import (action, api_view,
+                                       authentication_classes,
+                                       permission_classes)
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
-from api.filters import NameFilter, RecipeFilter
-from api.pagination import RecipePagination
+from api.cache import cache_anonymous_response
+from api.filters import RecipeFilter
+from api.fragments import get_recipe_fragments, personalize
+from api.ingredient_index import ingredient_index
+from api.pagination import (FeedPagination, RecipePagination,
+                            SubscriptionPagination)
 from api.permissions import DeleteAndUdateOnlyAuthor
 from api.serializers import (AvatarSerializer, FavoriteSerializer,
                              IngredientSerializer, RecipeCreateSerializer,
@@ -20,11 +29,17 @@ from api.serializers import (AvatarSerializer, FavoriteSerializer,
                              SubscriptionSerializer, TagSerializer,
                              UserCreateSerializer, UserSerializer,
                              UserSubscribeSerializer)
+from api.shopping_list import SHOPPING_LIST_FORMATS, ShoppingListNegotiation
+from food import short_links
 from food.models import (CookUser, Favorite, Follow, Ingredient, Recipe,
-                         RecipeIngredient, ShoppingCart, Tag)
+                         ShoppingCart, Tag)
 
 User = get_user_model()
 
+SHOPPING_LIST_CHUNK_SIZE = 2000
+RECIPE_LIST_CACHE_PARAMS = (
+    "tags", "author", "page", "limit", "cursor", "ordering")
+
 
 class UserCreateViewSet(viewsets.ModelViewSet):
     queryset = CookUser.objects.all()
@@ -66,9 +81,10 @@ class UserViewSet(DjoserUserViewSet):
 
         elif request.method == "DELETE":
             if user.avatar:
-                user.avatar.delete()
+                # Файл убирает периодическая задача collect_media:
+                # он может быть общим с другими записями.
                 user.avatar = None
-                user.save()
+                user.save(update_fields=["avatar"])
                 return Response(status=status.HTTP_204_NO_CONTENT)
 
             return Response(
@@ -103,11 +119,14 @@ class UserViewSet(DjoserUserViewSet):
         Follow.objects.get(user=request.user, following=author).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
-    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        pagination_class=SubscriptionPagination)
     def subscriptions(self, request):
         """Просмотр подписок"""
-        if request.user.is_authenticated:
-            queryset = User.objects.filter(followers__user=request.user)
+        queryset = self._get_subscriptions_queryset(request)
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -121,6 +140,30 @@ class UserViewSet(DjoserUserViewSet):
         )
         return Response(serializer.data)
 
+    def _get_subscriptions_queryset(self, request):
+        """Подписки с количеством рецептов и первыми recipes_limit рецептами
+        каждого автора, загруженными одним запросом на страницу."""
+        recipes = Recipe.objects.only(
+            "id", "name", "image", "image_renditions", "cooking_time",
+            "author_id")
+        recipes_limit = request.query_params.get("recipes_limit")
+        if recipes_limit and recipes_limit.isdigit():
+            recipes = recipes[:int(recipes_limit)]
+
+        return (
+            User.objects.filter(followers__user=request.user)
+            .annotate(
+                recipes_count=Count("recipes"),
+                is_subscribed=Value(True),
+            )
+            .prefetch_related(
+                Prefetch(
+                    "recipes",
+                    queryset=recipes,
+                    to_attr="subscription_recipes"))
+            .order_by("username")
+        )
+
 
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
 
@@ -128,6 +171,14 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     pagination_class = None
 
+    @cache_anonymous_response("tags")
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_anonymous_response("tags")
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет для ингредиентов."""
@@ -136,8 +187,26 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
     permission_classes = [AllowAny]
     pagination_class = None
-    filter_backends = (NameFilter, DjangoFilterBackend)
-    search_fields = ("^name",)
+
+    @cache_anonymous_response(
+        "ingredients", query_params=("name", "limit", "contains"))
+    def list(self, request, *args, **kwargs):
+        """Автодополнение по индексу в памяти, без запросов к базе.
+
+        name — начало названия, contains=true добавляет совпадения
+        по вхождению, limit ограничивает число результатов.
+        """
+        limit = request.query_params.get("limit")
+        contains = request.query_params.get("contains", "").lower()
+        return Response(ingredient_index.search(
+            request.query_params.get("name", ""),
+            limit=int(limit) if limit and limit.isdigit() else None,
+            contains=contains in ("1", "true"),
+        ))
+
+    @cache_anonymous_response("ingredients")
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
@@ -163,6 +232,61 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return [DeleteAndUdateOnlyAuthor()]
         return super().get_permissions()
 
+    @cache_anonymous_response(
+        "recipes", query_params=RECIPE_LIST_CACHE_PARAMS)
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = page if page is not None else list(queryset)
+
+        data = self._get_recipes_data(recipes)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    @cache_anonymous_response("recipes")
+    def retrieve(self, request, *args, **kwargs):
+        return Response(self._get_recipe_data(self.get_object()))
+
+    def _get_recipe_data(self, recipe):
+        """Один рецепт из кеша фрагментов. Рецепт, удалённый после
+        выборки, во фрагменты не попадает — тогда Http404."""
+        data = self._get_recipes_data([recipe])
+        if not data:
+            raise Http404
+        return data[0]
+
+    def _get_recipes_data(self, recipes):
+        """Рецепты из кеша фрагментов с флагами текущего пользователя."""
+        flags = self._get_user_flags(self.request.user, recipes)
+        return [
+            personalize(fragment, **flags)
+            for fragment in get_recipe_fragments(recipes, self.request)
+        ]
+
+    def _get_user_flags(self, user, recipes):
+        """Собирает id рецептов страницы в избранном и в корзине
+        и id их авторов в подписках пользователя, по запросу на флаг."""
+        if not user.is_authenticated:
+            return {
+                "favorited_ids": set(),
+                "in_shopping_cart_ids": set(),
+                "subscribed_author_ids": set(),
+            }
+        recipe_ids = [recipe.id for recipe in recipes]
+        return {
+            "favorited_ids": set(
+                user.favorites.filter(recipe_id__in=recipe_ids)
+                .values_list("recipe_id", flat=True)),
+            "in_shopping_cart_ids": set(
+                user.shopping_user.filter(recipe_id__in=recipe_ids)
+                .values_list("recipe_id", flat=True)),
+            "subscribed_author_ids": set(
+                user.following.filter(
+                    following_id__in={recipe.author_id for recipe in recipes})
+                .values_list("following_id", flat=True)),
+        }
+
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(
             data=request.data,
@@ -170,11 +294,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         recipe = serializer.save(author=self.request.user)
-
-        detail_serializer = RecipeDetailSerializer(
-            recipe, context={"request": request}
-        )
-        return Response(detail_serializer.data, status=status.HTTP_201_CREATED)
+        return Response(
+            self._get_recipe_data(recipe), status=status.HTTP_201_CREATED)
 
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop("partial", False)
@@ -187,32 +308,37 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
         serializer.is_valid(raise_exception=True)
         recipe = serializer.save()
-
-        detail_serializer = RecipeDetailSerializer(
-            recipe, context={"request": request}
-        )
-        return Response(detail_serializer.data)
+        return Response(self._get_recipe_data(recipe))
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
         instance.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[IsAuthenticated],
+        pagination_class=FeedPagination)
+    def feed(self, request):
+        """Рецепты авторов из подписок пользователя, сначала новые."""
+        recipes = self.paginate_queryset(
+            Recipe.objects.only("id", "author_id", "pub_date", "updated_at"))
+        return self.get_paginated_response(self._get_recipes_data(recipes))
+
     @action(detail=True, methods=["get"], url_path="get-link")
     def get_link(self, request, pk=None):
         """Возвращает короткую ссылку на рецепт."""
-        recipe = get_object_or_404(Recipe, id=pk)
-
-        if not recipe.short_link:
-            short_link = str(recipe.id)
-            recipe.short_link = short_link
-            recipe.save(update_fields=["short_link"])
+        recipe = get_object_or_404(Recipe.objects.only("short_link"), id=pk)
+        # До заполнения fill_short_links у старых рецептов кода нет,
+        # но resolve находит их и по вычисленному коду.
+        short_link = recipe.short_link or short_links.encode(recipe.id)
 
         scheme = request.scheme
         host = request.get_host()
 
         return Response(
-            {"short-link": f"{scheme}://{host}/r/{recipe.short_link}"},
+            {"short-link": f"{scheme}://{host}/r/{short_link}"},
             status=status.HTTP_200_OK,
         )
 
@@ -263,8 +389,10 @@ class RecipeViewSet(viewsets.ModelViewSet):
         if request.method == "POST":
             if shopping_cart_item:
                 return Response(status=status.HTTP_400_BAD_REQUEST)
-            shopping_cart_item = ShoppingCart.objects.create(
-                user=user, recipe=recipe)
+            # Список покупок меняется сигналом в той же транзакции.
+            with transaction.atomic():
+                shopping_cart_item = ShoppingCart.objects.create(
+                    user=user, recipe=recipe)
             serializer = ShoppingCartSerializer(shopping_cart_item)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -277,46 +405,87 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(
         detail=False,
         methods=["get"],
-        permission_classes=[IsAuthenticated])
+        permission_classes=[IsAuthenticated],
+        content_negotiation_class=ShoppingListNegotiation)
     def download_shopping_cart(self, request):
         """Скачивает список ингредиентов из корзины."""
-        ingredients = self._get_shopping_cart_ingredients(request.user)
-        if not ingredients:
+        export_format = request.query_params.get("format", "txt")
+        if export_format not in SHOPPING_LIST_FORMATS:
+            return Response(
+                {"error": "Неизвестный формат списка покупок."},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        version, last_modified = self._get_shopping_cart_version(
+            request.user)
+        if version is None:
             return Response(
                 {"error": "Корзина пуста."},
                 status=status.HTTP_400_BAD_REQUEST)
-        return self._generate_shopping_cart_response(ingredients)
+
+        etag = quote_etag(f"{version}-{export_format}")
+        # Удалённые из списка ингредиенты не сдвигают Last-Modified вперёд,
+        # поэтому 304 отдаётся только по ETag.
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            not_modified["ETag"] = etag
+            return not_modified
+
+        ingredients = self._get_shopping_cart_ingredients(request.user)
+        response = self._generate_shopping_cart_response(
+            ingredients, export_format)
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+        return response
 
     def _get_shopping_cart_ingredients(self, user):
         """Получает список ингредиентов для списка покупок."""
         return (
-            RecipeIngredient.objects.filter(recipe__shopping_recipe__user=user)
-            .values("ingredient__name", "ingredient__measurement_unit")
-            .annotate(amount=Sum("amount"))
+            user.shopping_list
+            .values("ingredient__name", "ingredient__measurement_unit",
+                    "amount")
+            .order_by("ingredient__name", "ingredient__measurement_unit")
         )
 
-    def _generate_shopping_cart_response(self, ingredients):
-        """Создаёт список покупок."""
-        shopping_list = StringIO()
-        shopping_list.write("Список покупок:\n\n")
-        for ingredient in ingredients:
-            shopping_list.write(
-                f"{ingredient['ingredient__name']} "
-                f"({ingredient['ingredient__measurement_unit']}) - "
-                f"{ingredient['amount']}\n"
-            )
-
-        response = HttpResponse(
-            shopping_list.getvalue(),
-            content_type="text/plain")
-        response[
-            "Content-Disposition"] = "attachment; filename='shopping_list.txt'"
+    def _get_shopping_cart_version(self, user):
+        """Хеш списка покупок и дата его последнего изменения. В хеш
+        входят название и единица измерения ингредиента: их правка
+        меняет файл, но не updated_at строк списка."""
+        rows = (
+            user.shopping_list
+            .order_by("ingredient_id")
+            .values_list("ingredient_id", "ingredient__name",
+                         "ingredient__measurement_unit", "amount",
+                         "updated_at")
+        )
+        digest = hashlib.md5(usedforsecurity=False)
+        last_modified = None
+        for ingredient_id, name, unit, amount, updated_at in rows.iterator(
+                chunk_size=SHOPPING_LIST_CHUNK_SIZE):
+            digest.update(
+                f"{ingredient_id}:{name}:{unit}:{amount};".encode())
+            if last_modified is None or updated_at > last_modified:
+                last_modified = updated_at
+        if last_modified is None:
+            return None, None
+        return digest.hexdigest(), last_modified
+
+    def _generate_shopping_cart_response(self, ingredients, export_format):
+        """Отдаёт список покупок потоком, читая строки серверным курсором."""
+        content_type, render = SHOPPING_LIST_FORMATS[export_format]
+        response = StreamingHttpResponse(
+            render(ingredients.iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)),
+            content_type=content_type)
+        response["Content-Disposition"] = (
+            f'attachment; filename="shopping_list.{export_format}"')
         return response
 
 
 @api_view(["GET"])
+@authentication_classes([])
 @permission_classes([AllowAny])
 def recipe_short_link(request, hash):
     """Возвращает рецепт по короткой ссылке."""
-    recipe = get_object_or_404(Recipe, short_link=hash)
-    return redirect(f"/recipes/{recipe.id}/")
+    recipe_id = short_links.resolve(hash)
+    if recipe_id is None:
+        raise Http404
+    return redirect(f"/recipes/{recipe_id}/")
@@ -0,0 +1,47 @@
+"""Прогрев кеша после его сброса.
+
+Изменение рецептов, тегов, ингредиентов или авторов сбрасывает поколения
+кеша ответов, фрагментов и количеств (api.signals), и первый запрос
+после этого собирает ответ из базы. Фоновая задача warm_caches заранее
+запрашивает от анонима первую страницу рецептов и список ингредиентов:
+их ответы, фрагменты рецептов и количество для пагинации попадают в
+общий кеш. Индекс ингредиентов в памяти каждый процесс перечитывает
+сам, его из воркера прогреть нельзя.
+"""
+
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.test import RequestFactory
+from django.urls import resolve, reverse
+
+from food import jobs
+
+WARM_PENDING_KEY = "cache_warm:pending"
+WARM_ROUTES = ("recipes-list", "ingredients-list")
+
+
+@jobs.task(priority=-5)
+def warm_caches():
+    """Запрашивает WARM_ROUTES так же, как анонимный пользователь."""
+    factory = RequestFactory()
+    for route in WARM_ROUTES:
+        request = factory.get(
+            reverse(route), SERVER_NAME=settings.CACHE_WARM_HOST)
+        match = resolve(request.path)
+        view = match.func
+        # При SERVER_MODE=asgi часть представлений асинхронные.
+        if iscoroutinefunction(view):
+            view = async_to_sync(view)
+        response = view(request, *match.args, **match.kwargs)
+        if hasattr(response, "render"):
+            response.render()
+
+
+def schedule():
+    """Ставит прогрев в очередь не чаще раза в CACHE_WARM_DELAY
+    секунд: сбросы за это время прогреваются одним запуском."""
+    if not settings.CACHE_WARM_HOST:
+        return
+    if cache.add(WARM_PENDING_KEY, True, settings.CACHE_WARM_DELAY):
+        jobs.enqueue(warm_caches, delay=settings.CACHE_WARM_DELAY)
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 from dotenv import load_dotenv
 
@@ -18,7 +19,7 @@ SECRET_KEY = os.getenv("DJANGO_SECRET_KEY", get_random_secret_key())
 
 
 # SECURITY WARNING: don"t run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv("DJANGO_DEBUG", "True").lower() == "true"
 
 ALLOWED_HOSTS = ["localhost", "127.0.0.1", "eda-dada.ru"]
 
@@ -42,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "instrumentation.middleware.InstrumentationMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -107,12 +109,159 @@ else:
     }
 
 
+# Cache
+# Redis в продакшене (REDIS_URL), иначе бэкенд из CACHE_BACKEND:
+# locmem по умолчанию или filebased для тестов. Поколения кеша
+# (api.cache) должны быть общими для всех процессов, поэтому без
+# DEBUG locmem не допускается.
+
+REDIS_URL = os.getenv("REDIS_URL")
+
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": os.getenv(
+                "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"),
+            "LOCATION": os.getenv("CACHE_LOCATION", "foodgram"),
+        }
+    }
+    if not DEBUG and CACHES["default"]["BACKEND"].endswith(".LocMemCache"):
+        raise ImproperlyConfigured(
+            "Кеш в памяти процесса не общий для воркеров и run_workers: "
+            "задайте REDIS_URL или CACHE_BACKEND.")
+
+# Время жизни закешированных ответов анонимным пользователям, в секундах.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv("RESPONSE_CACHE_TIMEOUT", 300))
+
+# Время жизни сериализованных рецептов в кеше фрагментов, в секундах.
+RECIPE_FRAGMENT_TIMEOUT = int(os.getenv("RECIPE_FRAGMENT_TIMEOUT", 86400))
+
+# Время жизни закешированного количества объектов в пагинации, в секундах.
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv("PAGINATION_COUNT_CACHE_TIMEOUT", 300))
+
+# Начиная с этого числа строк по оценке планировщика PostgreSQL количество
+# в пагинации не пересчитывается точно. 0 отключает оценку.
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = int(
+    os.getenv("PAGINATION_COUNT_ESTIMATE_THRESHOLD", 100000))
+
+# Режим сервера: wsgi (gunicorn с синхронными воркерами) или asgi
+# (gunicorn с воркерами uvicorn). В режиме asgi GET-запросы тегов,
+# ингредиентов, коротких ссылок и рецептов обслуживают асинхронные
+# представления api.async_views.
+SERVER_MODE = os.getenv("SERVER_MODE", "wsgi").lower()
+ASYNC_READ_VIEWS = SERVER_MODE == "asgi"
+
+# Фоновые задачи (food.jobs): число воркеров run_workers по умолчанию
+# и выполнение сразу после коммита в текущем потоке, без очереди.
+BACKGROUND_WORKERS = int(os.getenv("BACKGROUND_WORKERS", 2))
+BACKGROUND_TASKS_EAGER = (
+    os.getenv("BACKGROUND_TASKS_EAGER", "false").lower() == "true")
+# Попытки задачи, задержка перед первым повтором в секундах (дальше
+# удваивается), через сколько секунд задача зависшего воркера
+# возвращается в очередь и сколько секунд хранить выполненные задачи.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_DELAY = int(os.getenv("JOB_RETRY_DELAY", 10))
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", 600))
+JOB_KEEP_FINISHED = int(os.getenv("JOB_KEEP_FINISHED", 7 * 86400))
+# Интервалы периодических задач в секундах, 0 отключает задачу.
+JOB_RECONCILE_COUNTERS_INTERVAL = int(
+    os.getenv("JOB_RECONCILE_COUNTERS_INTERVAL", 86400))
+JOB_GC_MEDIA_INTERVAL = int(os.getenv("JOB_GC_MEDIA_INTERVAL", 86400))
+# Прогрев кеша после сброса (api.warmup): хост, для которого кешируются
+# ответы (пустой — без прогрева), и сколько секунд собирать сбросы
+# в один прогрев.
+CACHE_WARM_HOST = os.getenv("CACHE_WARM_HOST", "eda-dada.ru")
+CACHE_WARM_DELAY = int(os.getenv("CACHE_WARM_DELAY", 5))
+
+# Лента подписок: с этого числа подписчиков рецепты автора не раскладываются
+# по лентам, а читаются при запросе ленты; время жизни кеша таких авторов.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv("FEED_FANOUT_MAX_FOLLOWERS", 10000))
+FEED_POPULAR_AUTHORS_CACHE_TIMEOUT = int(
+    os.getenv("FEED_POPULAR_AUTHORS_CACHE_TIMEOUT", 300))
+
+# Уменьшенные копии изображений: наибольшая сторона в пикселях по размерам,
+# форматы и качество сжатия.
+IMAGE_RENDITIONS = {
+    "thumbnail": 160,
+    "card": 480,
+    "full": 1280,
+}
+IMAGE_RENDITION_FORMATS = ("webp", "jpeg")
+IMAGE_RENDITION_QUALITY = int(os.getenv("IMAGE_RENDITION_QUALITY", 80))
+
+# Изображения в base64: наибольший размер после декодирования в байтах,
+# наибольшее число пикселей и сколько байт держать в памяти до записи
+# во временный файл на диске.
+IMAGE_UPLOAD_MAX_SIZE = int(os.getenv("IMAGE_UPLOAD_MAX_SIZE", 5 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv("IMAGE_UPLOAD_MAX_PIXELS", 40_000_000))
+IMAGE_UPLOAD_SPOOL_SIZE = int(os.getenv("IMAGE_UPLOAD_SPOOL_SIZE", 1024 * 1024))
+
+
 STATIC_URL = "/static/"
 STATIC_ROOT = BASE_DIR / "collected_static"
 
 MEDIA_URL = "/media/"
 MEDIA_ROOT = "/app/media"
 
+# Короткие ссылки: размер LRU в памяти процесса и время жизни в общем кеше.
+SHORT_LINK_LRU_SIZE = int(os.getenv("SHORT_LINK_LRU_SIZE", 10000))
+SHORT_LINK_CACHE_TIMEOUT = int(os.getenv("SHORT_LINK_CACHE_TIMEOUT", 86400))
+
+# Показатели запросов (instrumentation): заголовок Server-Timing и прирост
+# SQL-запросов на элемент страницы, после которого эндпоинт помечается
+# как N+1 (0 отключает проверку).
+INSTRUMENTATION_SERVER_TIMING = (
+    os.getenv("INSTRUMENTATION_SERVER_TIMING", "false").lower() == "true")
+INSTRUMENTATION_QUERY_GROWTH_THRESHOLD = float(
+    os.getenv("INSTRUMENTATION_QUERY_GROWTH_THRESHOLD", 0.5))
+# Токен для /metrics (Authorization: Bearer <токен>). Без токена метрики
+# видят только сотрудники, вошедшие в админку.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(message)s"},
+    },
+    "handlers": {
+        "instrumentation": {
+            "class": "logging.StreamHandler",
+            "formatter": "plain",
+        },
+    },
+    "loggers": {
+        "instrumentation": {
+            "handlers": ["instrumentation"],
+            "level": os.getenv("INSTRUMENTATION_LOG_LEVEL", "WARNING"),
+            "propagate": False,
+        },
+        "food.jobs": {
+            "handlers": ["instrumentation"],
+            "level": os.getenv("JOB_LOG_LEVEL", "INFO"),
+            "propagate": False,
+        },
+    },
+}
+
+# Медиафайлы именуются по хешу содержимого (food.storage).
+STORAGES = {
+    "default": {
+        "BACKEND": "food.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 AUTH_USER_MODEL = "food.CookUser"
 
 # Password validation
@@ -186,3 +335,7 @@ DJOSER = {
     },
 
 }
+
+# Поиск ингредиентов по вхождению через триграммный индекс в памяти.
+INGREDIENT_INDEX_TRIGRAMS = (
+    os.getenv("INGREDIENT_INDEX_TRIGRAMS", "True").lower() == "true")
@@ -1,8 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.utils import timezone
 
-from food.models import Ingredient, Recipe, Tag
+from food.models import Ingredient, Job, Recipe, Tag
 
 User = get_user_model()
 
@@ -38,7 +39,14 @@ class RecipeAdmin(admin.ModelAdmin):
         "pub_date",
         "get_ingredients",
         "get_tags",
-        "cooking_time")
+        "cooking_time",
+        "favorites_count",
+        "in_carts_count")
+    list_select_related = ("author",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            "ingredients", "tags")
 
     def get_ingredients(self, obj):
         return ", ".join(
@@ -48,3 +56,23 @@ class RecipeAdmin(admin.ModelAdmin):
     def get_tags(self, obj):
         return ", ".join([tag.name for tag in obj.tags.all()])
     get_tags.short_description = "Tags"
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "name",
+        "status",
+        "priority",
+        "attempts",
+        "run_at",
+        "duration")
+    list_filter = ("status", "name")
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ["retry"]
+
+    @admin.action(description="Повторить выбранные задачи")
+    def retry(self, request, queryset):
+        queryset.exclude(status=Job.Status.RUNNING).update(
+            status=Job.Status.QUEUED, attempts=0, run_at=timezone.now())
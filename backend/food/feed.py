@@ -0,0 +1,138 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Новый рецепт раскладывается по лентам подписчиков автора (FeedEntry)
+в фоновой задаче (food.jobs). У авторов, на которых подписано не меньше
+FEED_FANOUT_MAX_FOLLOWERS пользователей, рецепты не раскладываются:
+при чтении ленты они берутся из таблицы рецептов по индексу
+(author, -pub_date) и сливаются с записями ленты.
+
+Обе выборки идут по индексам в порядке (pub_date, id) и читают не
+больше страницы, поэтому стоимость чтения не зависит от числа
+подписок. Если автор перестал быть популярным, его старые рецепты
+попадут в ленты после команды rebuild_feeds. Популярные авторы
+выбираются по счётчику подписчиков (food.follower_counters).
+"""
+
+from heapq import merge
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+
+from food import jobs
+from food.models import FeedEntry, Follow, Recipe
+
+POPULAR_AUTHORS_KEY = "feed:popular_authors"
+BATCH_SIZE = 1000
+
+User = get_user_model()
+
+
+def get_popular_author_ids():
+    """id авторов, рецепты которых не раскладываются по лентам."""
+    author_ids = cache.get(POPULAR_AUTHORS_KEY)
+    if author_ids is None:
+        author_ids = set(
+            User.objects.filter(
+                followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS)
+            .values_list("id", flat=True)
+        )
+        cache.set(POPULAR_AUTHORS_KEY, author_ids,
+                  settings.FEED_POPULAR_AUTHORS_CACHE_TIMEOUT)
+    return author_ids
+
+
+def _insert(entries):
+    FeedEntry.objects.bulk_create(
+        entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+@jobs.task
+def fan_out(recipe_id):
+    """Добавляет рецепт в ленты подписчиков его автора."""
+    recipe = Recipe.objects.filter(id=recipe_id).only(
+        "id", "author_id", "pub_date").first()
+    if recipe is None or recipe.author_id in get_popular_author_ids():
+        return
+    follower_ids = Follow.objects.filter(
+        following_id=recipe.author_id).values_list("user_id", flat=True)
+    _insert(
+        FeedEntry(user_id=user_id, recipe_id=recipe.id,
+                  author_id=recipe.author_id, pub_date=recipe.pub_date)
+        for user_id in follower_ids.iterator()
+    )
+
+
+@jobs.task
+def add_author(user_id, author_id):
+    """Добавляет рецепты автора в ленту нового подписчика.
+
+    Пользователь мог отписаться, пока задача ждала в очереди.
+    Строка подписки блокируется до конца вставки, поэтому отписка
+    (remove_author) выполнится после неё и уберёт вставленное.
+    """
+    if author_id in get_popular_author_ids():
+        return
+    with transaction.atomic():
+        follow = Follow.objects.select_for_update().filter(
+            user_id=user_id, following_id=author_id).first()
+        if follow is None:
+            return
+        recipes = Recipe.objects.filter(author_id=author_id).values_list(
+            "id", "pub_date")
+        _insert(
+            FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes.iterator()
+        )
+
+
+def remove_author(user_id, author_id):
+    """Убирает рецепты автора из ленты отписавшегося пользователя."""
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild(user_id=None):
+    """Пересобирает ленты из подписок. Возвращает число записей."""
+    follows = Follow.objects.exclude(following_id__in=get_popular_author_ids())
+    entries = FeedEntry.objects.all()
+    if user_id is not None:
+        follows = follows.filter(user_id=user_id)
+        entries = entries.filter(user_id=user_id)
+    with transaction.atomic():
+        entries.delete()
+        for user, author in follows.values_list(
+                "user_id", "following_id").iterator():
+            add_author(user, author)
+    return entries.count()
+
+
+def _after(position, date_field, id_field):
+    pub_date, pk = position
+    return Q(**{f"{date_field}__lt": pub_date}) | Q(
+        **{date_field: pub_date, f"{id_field}__lt": pk})
+
+
+def get_page(user, position, size):
+    """Ключи (pub_date, id) рецептов ленты после position, не больше
+    size. position — ключ последнего рецепта предыдущей страницы."""
+    popular = get_popular_author_ids()
+    entries = FeedEntry.objects.filter(user=user).exclude(
+        author_id__in=popular)
+    recipes = Recipe.objects.filter(
+        author_id__in=Follow.objects.filter(
+            user=user, following_id__in=popular).values("following_id"))
+    if position is not None:
+        entries = entries.filter(_after(position, "pub_date", "recipe_id"))
+        recipes = recipes.filter(_after(position, "pub_date", "id"))
+    entries = entries.order_by("-pub_date", "-recipe_id").values_list(
+        "pub_date", "recipe_id")[:size]
+    keys = list(entries)
+    if popular:
+        recipes = recipes.order_by("-pub_date", "-id").values_list(
+            "pub_date", "id")[:size]
+        keys = list(islice(merge(keys, recipes, reverse=True), size))
+    return keys
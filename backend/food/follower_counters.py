@@ -0,0 +1,56 @@
+"""Число подписчиков у авторов.
+
+CookUser.followers_count меняется одним UPDATE с F() при добавлении
+и удалении подписок, как счётчики рецептов в food.recipe_counters.
+По нему лента (food.feed) находит популярных авторов без GROUP BY
+по всем подпискам. Записи в обход сигналов исправляет reconcile.
+"""
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from food.models import Follow
+
+User = get_user_model()
+
+
+def change(author_id, delta):
+    """Прибавляет delta к счётчику автора, не опуская его ниже нуля."""
+    authors = User.objects.filter(pk=author_id)
+    if delta < 0:
+        authors = authors.filter(followers_count__gte=-delta)
+    authors.update(followers_count=F("followers_count") + delta)
+
+
+def get_live_count():
+    """Выражение с числом подписчиков каждого пользователя."""
+    return Coalesce(
+        Subquery(
+            Follow.objects.filter(following=OuterRef("pk")).order_by()
+            .values("following").annotate(total=Count("pk"))
+            .values("total")
+        ),
+        Value(0),
+    )
+
+
+def reconcile(batch_size=1000):
+    """Пересчитывает счётчики по диапазонам id, по batch_size
+    пользователей за UPDATE. Возвращает число исправленных."""
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = list(
+            User.objects.filter(id__gt=last_id).order_by("id")
+            .values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return fixed
+        last_id = ids[-1]
+        mismatched = User.objects.filter(
+            id__gte=ids[0], id__lte=last_id).annotate(
+                live=get_live_count()).exclude(
+                    followers_count=F("live"))
+        fixed += User.objects.filter(
+            pk__in=mismatched.values("pk")
+        ).update(followers_count=get_live_count())
@@ -0,0 +1,138 @@
+"""Уменьшенные копии загруженных изображений.
+
+Для поля изображения field модель хранит в JSON-поле field_renditions
+имя исходного файла и пути копий по размерам и форматам:
+
+    {"source": "dishes/x.png",
+     "sizes": {"thumbnail": {"webp": "...", "jpeg": "..."}, ...}}
+
+Пока копии готовятся, в поле записан только source. Копии строятся
+фоновой задачей: изображение поворачивается по EXIF, метаданные
+отбрасываются, размер уменьшается до IMAGE_RENDITIONS.
+"""
+
+import logging
+import posixpath
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+from food import jobs
+from food.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+# Модели и поля изображений, для которых строятся копии.
+IMAGE_FIELDS = ((Recipe, "image"), (get_user_model(), "avatar"))
+
+
+def get_renditions_field(field):
+    return f"{field}_renditions"
+
+
+def get_rendition_names(renditions):
+    """Пути всех файлов копий из значения поля *_renditions."""
+    return [
+        name
+        for files in renditions.get("sizes", {}).values()
+        for name in files.values()
+    ]
+
+
+def _flatten(image):
+    """Копия без прозрачности на белом фоне для JPEG."""
+    if image.mode == "RGB":
+        return image
+    background_image = Image.new("RGB", image.size, "white")
+    background_image.paste(image, mask=image.getchannel("A"))
+    return background_image
+
+
+def make_renditions(file):
+    """Сохраняет уменьшенные копии файла изображения в его хранилище
+    и возвращает их пути: {размер: {формат: путь}}."""
+    with file.open("rb"):
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA") or (
+        image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    stem = posixpath.splitext(posixpath.basename(file.name))[0]
+    sizes = {}
+    for rendition, max_side in settings.IMAGE_RENDITIONS.items():
+        resized = image.copy()
+        # thumbnail не увеличивает изображения меньше max_side.
+        resized.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        sizes[rendition] = {}
+        for image_format in settings.IMAGE_RENDITION_FORMATS:
+            output = resized if image_format == "webp" else _flatten(resized)
+            buffer = BytesIO()
+            output.save(
+                buffer,
+                format=image_format.upper(),
+                quality=settings.IMAGE_RENDITION_QUALITY,
+                exif=b"",
+            )
+            name = file.field.generate_filename(
+                file.instance,
+                f"{stem}_{rendition}.{EXTENSIONS[image_format]}")
+            sizes[rendition][image_format] = file.storage.save(
+                name, ContentFile(buffer.getvalue()))
+    return sizes
+
+
+@jobs.task(priority=10)
+def process_image(model_label, pk, field):
+    """Фоновая задача: строит копии изображения и сохраняет их пути."""
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    file = getattr(instance, field)
+    if not file:
+        return
+    source = file.name
+    try:
+        sizes = make_renditions(file)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning("Не удалось обработать изображение %s", source,
+                       exc_info=True)
+        sizes = {}
+
+    # Пока строились копии, изображение могли заменить.
+    if not model.objects.filter(pk=pk, **{field: source}).exists():
+        return
+    renditions_field = get_renditions_field(field)
+    setattr(instance, renditions_field, {"source": source, "sizes": sizes})
+    update_fields = [renditions_field] + [
+        model_field.name for model_field in model._meta.concrete_fields
+        if getattr(model_field, "auto_now", False)
+    ]
+    instance.save(update_fields=update_fields)
+
+
+def schedule_renditions(instance, field):
+    """Ставит задачу на копии, если изображение изменилось с прошлой
+    обработки. Устаревшие копии сразу убираются из записи."""
+    file = getattr(instance, field)
+    renditions_field = get_renditions_field(field)
+    renditions = getattr(instance, renditions_field)
+    source = file.name if file else None
+    if renditions.get("source") == source:
+        return
+
+    renditions = {"source": source} if source else {}
+    setattr(instance, renditions_field, renditions)
+    type(instance).objects.filter(pk=instance.pk).update(
+        **{renditions_field: renditions})
+    if source:
+        jobs.enqueue(
+            process_image, instance._meta.label, instance.pk, field)
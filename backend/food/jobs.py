@@ -0,0 +1,305 @@
+"""Очередь фоновых задач в таблице базы данных.
+
+Функция становится задачей с декоратором task и ставится в очередь
+через enqueue. Запись Job создаётся в текущей транзакции: если она
+откатится, задачи не будет. Выполняет задачи команда run_workers,
+брокер вроде Redis для этого не нужен.
+
+Воркер забирает задачу условным UPDATE по состоянию, поэтому одну
+задачу не выполнят двое и без SELECT ... FOR UPDATE, которого нет
+в SQLite. Упавшая задача повторяется через JOB_RETRY_DELAY секунд,
+с каждой попыткой вдвое дольше, пока не кончатся попытки. Пока задача
+выполняется, воркер обновляет её heartbeat_at; задачу воркера, от
+которого JOB_LOCK_TIMEOUT секунд не было сигнала, забирает другой.
+
+При BACKGROUND_TASKS_EAGER задачи выполняются без очереди сразу
+после коммита, в текущем потоке.
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import (IntegrityError, close_old_connections, connection,
+                       transaction)
+from django.db.models import Count, F, Min, Sum
+from django.utils import timezone
+
+from food.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Задача по имени: модуль и имя функции.
+_tasks = {}
+# Сколько задач из начала очереди пробовать забрать за раз.
+CLAIM_CANDIDATES = 10
+
+
+def task(func=None, *, priority=0, max_attempts=None, every=None):
+    """Регистрирует функцию как задачу.
+
+    priority — чем больше, тем раньше задача выполняется; every —
+    интервал в секундах, с которым воркеры сами ставят задачу в
+    очередь (None или 0 — только по enqueue).
+    """
+    if func is None:
+        return lambda func: task(
+            func, priority=priority, max_attempts=max_attempts, every=every)
+    func.job_name = f"{func.__module__}.{func.__qualname__}"
+    func.job_priority = priority
+    func.job_max_attempts = max_attempts
+    func.job_every = every
+    _tasks[func.job_name] = func
+    return func
+
+
+def _call(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Фоновая задача %s завершилась ошибкой",
+                         func.job_name)
+
+
+def enqueue(func, *args, priority=None, delay=0):
+    """Ставит задачу func(*args) в очередь. Аргументы должны
+    сериализоваться в JSON."""
+    if not hasattr(func, "job_name"):
+        raise ValueError(f"{func.__qualname__} не зарегистрирована как задача")
+    if settings.BACKGROUND_TASKS_EAGER:
+        transaction.on_commit(lambda: _call(func, args))
+        return None
+    return _create(func, args, priority, delay)
+
+
+def _create(func, args, priority=None, delay=0, periodic=False):
+    return Job.objects.create(
+        name=func.job_name,
+        args=list(args),
+        priority=func.job_priority if priority is None else priority,
+        max_attempts=func.job_max_attempts or settings.JOB_MAX_ATTEMPTS,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        periodic=periodic,
+    )
+
+
+def get_worker_name():
+    return (f"{socket.gethostname()}:{os.getpid()}:"
+            f"{threading.current_thread().name}")
+
+
+def claim(worker):
+    """Забирает следующую задачу из очереди или возвращает None."""
+    now = timezone.now()
+    candidates = list(
+        Job.objects.filter(status=Job.Status.QUEUED, run_at__lte=now)
+        .order_by("-priority", "run_at", "id")
+        .values_list("id", flat=True)[:CLAIM_CANDIDATES])
+    for job_id in candidates:
+        claimed = Job.objects.filter(
+            id=job_id, status=Job.Status.QUEUED).update(
+            status=Job.Status.RUNNING,
+            attempts=F("attempts") + 1,
+            locked_by=worker,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.get(id=job_id)
+    return None
+
+
+@contextmanager
+def heartbeat(job):
+    """Пока выполняется блок, раз в треть JOB_LOCK_TIMEOUT обновляет
+    heartbeat_at задачи из отдельного потока, чтобы release_stale не
+    вернул в очередь долгую задачу, которая ещё выполняется."""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(settings.JOB_LOCK_TIMEOUT / 3):
+                try:
+                    Job.objects.filter(
+                        id=job.id, status=Job.Status.RUNNING,
+                        locked_by=job.locked_by,
+                    ).update(heartbeat_at=timezone.now())
+                except Exception:
+                    logger.exception(
+                        "Не удалось обновить heartbeat_at задачи %s", job.id)
+        finally:
+            # У потока своё соединение с базой.
+            connection.close()
+
+    thread = threading.Thread(
+        target=beat, name=f"{threading.current_thread().name}-heartbeat",
+        daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run(job):
+    """Выполняет забранную задачу и записывает результат."""
+    func = _tasks.get(job.name)
+    started = time.monotonic()
+    try:
+        if func is None:
+            raise LookupError(f"Задача {job.name} не зарегистрирована")
+        with heartbeat(job):
+            func(*job.args)
+    except Exception:
+        job.error = traceback.format_exc()
+        if func is not None and job.attempts < job.max_attempts:
+            job.status = Job.Status.QUEUED
+            job.run_at = timezone.now() + timedelta(
+                seconds=settings.JOB_RETRY_DELAY * 2 ** (job.attempts - 1))
+        else:
+            job.status = Job.Status.FAILED
+    else:
+        job.status = Job.Status.DONE
+        job.error = ""
+    job.duration = time.monotonic() - started
+    job.finished_at = timezone.now()
+    job.save(update_fields=[
+        "status", "run_at", "finished_at", "duration", "error"])
+
+    if job.status == Job.Status.DONE:
+        log = logger.info
+    elif job.status == Job.Status.QUEUED:
+        log = logger.warning
+    else:
+        log = logger.error
+    log(json.dumps({
+        "job": job.name,
+        "id": job.id,
+        "status": job.status,
+        "attempt": job.attempts,
+        "duration_ms": round(job.duration * 1000, 2),
+    }, ensure_ascii=False))
+    return job
+
+
+def release_stale():
+    """Возвращает в очередь задачи, от воркера которых JOB_LOCK_TIMEOUT
+    секунд не было сигнала: он, скорее всего, остановился."""
+    deadline = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    stale = Job.objects.filter(
+        status=Job.Status.RUNNING, heartbeat_at__lt=deadline)
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.Status.FAILED, finished_at=timezone.now(),
+        error="Воркер не завершил задачу")
+    return failed + stale.update(status=Job.Status.QUEUED, locked_by="")
+
+
+def prune():
+    """Удаляет выполненные задачи старше JOB_KEEP_FINISHED секунд."""
+    deadline = timezone.now() - timedelta(
+        seconds=settings.JOB_KEEP_FINISHED)
+    return Job.objects.filter(
+        status=Job.Status.DONE, finished_at__lt=deadline).delete()[0]
+
+
+def schedule_periodic():
+    """Ставит в очередь периодические задачи, которые пора запустить.
+
+    Задача не ставится, пока её прошлый запуск в очереди или
+    выполняется: если её одновременно ставят несколько воркеров,
+    лишние записи отклоняет ограничение unique_active_periodic_job.
+    """
+    now = timezone.now()
+    for name, func in _tasks.items():
+        if not func.job_every:
+            continue
+        last = Job.objects.filter(name=name).order_by("-created_at").first()
+        if last is not None and (
+                last.status in (Job.Status.QUEUED, Job.Status.RUNNING)
+                or last.created_at > now - timedelta(seconds=func.job_every)):
+            continue
+        try:
+            with transaction.atomic():
+                _create(func, (), periodic=True)
+        except IntegrityError:
+            continue
+
+
+def get_stats():
+    """Число задач по имени и состоянию, суммарная длительность
+    выполненных и возраст самой старой задачи, ждущей выполнения."""
+    rows = (
+        Job.objects.order_by().values("name", "status")
+        .annotate(total=Count("id"), duration=Sum("duration"))
+    )
+    oldest = Job.objects.filter(
+        status=Job.Status.QUEUED, run_at__lte=timezone.now(),
+    ).aggregate(run_at=Min("run_at"))["run_at"]
+    return {
+        "jobs": [
+            {**row, "duration": row["duration"] or 0.0} for row in rows],
+        "oldest_queued_seconds": (
+            (timezone.now() - oldest).total_seconds() if oldest else 0.0),
+        "retrying": Job.objects.filter(
+            status=Job.Status.QUEUED, attempts__gt=0).count(),
+    }
+
+
+class Worker:
+    """Цикл одного воркера: берёт задачи, пока очередь не пуста,
+    потом ждёт poll_interval секунд. Обслуживание очереди (зависшие,
+    старые и периодические задачи) — не чаще раза в минуту."""
+
+    MAINTENANCE_INTERVAL = 60
+
+    def __init__(self, stop_event, poll_interval=1.0, burst=False):
+        self.stop_event = stop_event
+        self.poll_interval = poll_interval
+        self.burst = burst
+        self.processed = 0
+        self._maintained = 0.0
+
+    def maintain(self):
+        if time.monotonic() - self._maintained < self.MAINTENANCE_INTERVAL:
+            return
+        self._maintained = time.monotonic()
+        release_stale()
+        prune()
+        schedule_periodic()
+
+    def step(self, name):
+        """Выполняет одну задачу из очереди. Возвращает False, если
+        очередь пуста."""
+        # Соединение могло оборваться, например при перезапуске базы.
+        close_old_connections()
+        job = claim(name)
+        if job is None:
+            return False
+        run(job)
+        self.processed += 1
+        return True
+
+    def run(self):
+        name = get_worker_name()
+        while not self.stop_event.is_set():
+            try:
+                if self.step(name):
+                    continue
+                if self.burst:
+                    return
+                self.maintain()
+            except Exception:
+                # Ошибка базы не должна останавливать воркер: задачу,
+                # которую не удалось записать, вернёт release_stale.
+                logger.exception("Ошибка воркера %s", name)
+                if self.burst:
+                    return
+            self.stop_event.wait(self.poll_interval)
@@ -0,0 +1,375 @@
+"""Команда для измерения задержек и пропускной способности API."""
+
+import json
+import random
+import re
+import socket
+import subprocess
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone
+from functools import partial
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client
+from django.test.utils import override_settings
+
+from food.management.commands.seed_benchmark import DEFAULT_PASSWORD, EMAIL
+
+DEFAULT_COLLECTION = '../postman_collection/foodgram.postman_collection.json'
+VARIABLE_RE = re.compile(r'{{(\w+)}}')
+SERVER_TIMING_QUERIES_RE = re.compile(r'desc="(\d+) queries"')
+PERCENTILES = (50, 95, 99)
+
+
+def read_collection(path):
+    """GET-запросы коллекции Postman: (метод, путь, нужен ли токен).
+
+    Изменяющие запросы не воспроизводятся: после них набор данных
+    и результаты следующих запусков были бы другими.
+    """
+    with open(path, encoding='utf-8') as file:
+        collection = json.load(file)
+
+    def walk(items):
+        for item in items:
+            if 'item' in item:
+                yield from walk(item['item'])
+                continue
+            request = item['request']
+            if request['method'] != 'GET':
+                continue
+            url = request['url']
+            raw = url['raw'] if isinstance(url, dict) else url
+            auth = (request.get('auth') or {}).get('type')
+            yield 'GET', raw.replace('{{baseUrl}}', ''), auth != 'noauth'
+
+    return list(walk(collection['item']))
+
+
+def percentile(values, percent):
+    """Перцентиль с линейной интерполяцией по отсортированному списку."""
+    if not values:
+        return None
+    position = (len(values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (
+        position - lower)
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LocalTransport:
+    """Запросы к приложению в этом же процессе через django.test.Client."""
+
+    target = 'local'
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, token=None, data=None):
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        response = self.client.generic(
+            method, path, json.dumps(data) if data is not None else '',
+            content_type='application/json', **headers)
+        if response.streaming:
+            body = b''.join(response.streaming_content)
+        else:
+            body = response.content
+        return response.status_code, body, response.get('Server-Timing')
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpTransport:
+    """Запросы к запущенному серверу (runserver, gunicorn, nginx)."""
+
+    def __init__(self, base_url):
+        self.target = base_url
+        self.session = requests.Session()
+
+    def request(self, method, path, token=None, data=None):
+        headers = {'Authorization': f'Token {token}'} if token else {}
+        response = self.session.request(
+            method, urljoin(self.target, path), json=data, headers=headers,
+            allow_redirects=False)
+        return (response.status_code, response.content,
+                response.headers.get('Server-Timing'))
+
+    def close(self):
+        self.session.close()
+
+
+@contextmanager
+def hold_connections(base_url, count):
+    """Держит count открытых соединений с сервером, по которым не
+    приходит запросов, как у медленных клиентов и keep-alive
+    браузеров. Синхронный воркер занят таким соединением, пока не
+    истечёт его таймаут, асинхронный — нет."""
+    url = urlsplit(base_url)
+    port = url.port or (443 if url.scheme == 'https' else 80)
+    sockets = []
+    try:
+        for _ in range(count):
+            sockets.append(socket.create_connection((url.hostname, port)))
+        yield
+    finally:
+        for sock in sockets:
+            sock.close()
+
+
+class Command(BaseCommand):
+    """Воспроизводит GET-запросы коллекции Postman и сохраняет задержки."""
+
+    help = (
+        'Replay the GET requests of the Postman collection against the '
+        'seeded database and report latency percentiles, throughput and '
+        'SQL queries per request as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            help='Base URL of a running server; by default requests go '
+                 'to the application in this process')
+        parser.add_argument('--collection', default=DEFAULT_COLLECTION)
+        parser.add_argument('--iterations', type=int, default=20,
+                            help='Passes over the request mix')
+        parser.add_argument('--warmup', type=int, default=1,
+                            help='Passes that are not measured')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--email', default=EMAIL.format(number=0),
+                            help='User for authenticated requests')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed for the request order')
+        parser.add_argument(
+            '--idle-connections', type=int, default=0,
+            help='Idle connections to keep open to --url while measuring')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument(
+            '--compare',
+            help='Previous result to compare p95 latency against')
+        parser.add_argument(
+            '--max-regression', type=float,
+            help='Fail when p95 of an endpoint grows by more percent '
+                 'than this compared to --compare')
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        idle = nullcontext()
+        if options['url']:
+            make_transport = partial(HttpTransport, options['url'])
+            # Число запросов сервер сообщает в Server-Timing, если
+            # у него включён INSTRUMENTATION_SERVER_TIMING.
+            timing = nullcontext()
+            if options['idle_connections']:
+                idle = hold_connections(
+                    options['url'], options['idle_connections'])
+        elif options['idle_connections']:
+            raise CommandError('--idle-connections работает только с --url.')
+        else:
+            make_transport = LocalTransport
+            timing = override_settings(
+                INSTRUMENTATION_SERVER_TIMING=True,
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'])
+
+        with timing:
+            transport = make_transport()
+            token = self.login(transport, options)
+            variables = self.get_variables(transport, token)
+            transport.close()
+            mix = self.build_mix(options['collection'], variables)
+            for _ in range(options['warmup']):
+                self.run(make_transport, mix, token, 1, options['seed'])
+            with idle:
+                started = time.perf_counter()
+                samples = self.run(
+                    make_transport, mix * options['iterations'], token,
+                    options['concurrency'], options['seed'])
+                elapsed = time.perf_counter() - started
+
+        result = {
+            'commit': get_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'target': transport.target,
+            'iterations': options['iterations'],
+            'concurrency': options['concurrency'],
+            'idle_connections': options['idle_connections'],
+            'requests': len(samples),
+            'duration_s': round(elapsed, 3),
+            'rps': round(len(samples) / elapsed, 1),
+            'endpoints': self.summarize(samples),
+        }
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+        self.report(result, options['output'])
+        if options['compare']:
+            self.compare(result, options['compare'],
+                         options['max_regression'])
+
+    def login(self, transport, options):
+        status, body, _ = transport.request(
+            'POST', '/api/auth/token/login/',
+            data={'email': options['email'], 'password': options['password']})
+        if status != 200:
+            raise CommandError(
+                f'Не удалось войти как {options["email"]}: {status}. '
+                'Создайте данные командой seed_benchmark.')
+        return json.loads(body)['auth_token']
+
+    def get_variables(self, transport, token):
+        """Значения переменных коллекции из данных на сервере."""
+        def get(path):
+            status, body, _ = transport.request('GET', path, token)
+            if status != 200:
+                raise CommandError(f'GET {path} вернул {status}.')
+            return json.loads(body)
+
+        recipes = get('/api/recipes/?limit=1')['results']
+        if not recipes:
+            raise CommandError('В базе нет рецептов.')
+        recipe = get(f'/api/recipes/{recipes[0]["id"]}/')
+        tags = get('/api/tags/')
+        if not tags:
+            raise CommandError('В базе нет тегов.')
+        # Коллекции нужны три тега, при меньшем числе они повторяются.
+        tags = [tags[min(index, len(tags) - 1)] for index in range(3)]
+        ingredient = recipe['ingredients'][0]
+        return {
+            'userId': get('/api/users/me/')['id'],
+            'firstRecipeId': recipe['id'],
+            'firstTagId': tags[0]['id'],
+            'secondTagSlug': tags[1]['slug'],
+            'thirdTagSlug': tags[2]['slug'],
+            'firstIndredientId': ingredient['id'],
+            'ingredientNameFirstLatter': ingredient['name'][0],
+        }
+
+    def build_mix(self, path, variables):
+        mix = []
+        for method, url, authenticated in read_collection(path):
+            names = set(VARIABLE_RE.findall(url))
+            if names - variables.keys():
+                self.stderr.write(f'Пропущен {method} {url}: неизвестные '
+                                  f'переменные {", ".join(sorted(names))}')
+                continue
+            mix.append((
+                f'{method} {url}' + ('' if authenticated else ' [anonymous]'),
+                method,
+                VARIABLE_RE.sub(lambda match: str(variables[match[1]]), url),
+                authenticated,
+            ))
+        if not mix:
+            raise CommandError('В коллекции нет подходящих запросов.')
+        return mix
+
+    def run(self, make_transport, requests_, token, concurrency, seed):
+        """Выполняет запросы в случайном порядке и возвращает замеры."""
+        requests_ = list(requests_)
+        random.Random(seed).shuffle(requests_)
+        chunks = [requests_[index::concurrency]
+                  for index in range(concurrency)]
+
+        def worker(chunk):
+            transport = make_transport()
+            samples = []
+            try:
+                for label, method, path, authenticated in chunk:
+                    started = time.perf_counter()
+                    status, _, server_timing = transport.request(
+                        method, path, token if authenticated else None)
+                    duration = time.perf_counter() - started
+                    queries = SERVER_TIMING_QUERIES_RE.search(
+                        server_timing or '')
+                    samples.append((
+                        label, status, duration,
+                        int(queries[1]) if queries else None))
+            finally:
+                transport.close()
+            return samples
+
+        with ThreadPoolExecutor(concurrency) as executor:
+            return [
+                sample
+                for samples in executor.map(worker, chunks)
+                for sample in samples
+            ]
+
+    def summarize(self, samples):
+        grouped = defaultdict(list)
+        for label, *sample in samples:
+            grouped[label].append(sample)
+
+        endpoints = {}
+        for label, group in sorted(grouped.items()):
+            durations = sorted(duration * 1000 for _, duration, _ in group)
+            statuses = defaultdict(int)
+            for status, _, _ in group:
+                statuses[str(status)] += 1
+            queries = [count for _, _, count in group if count is not None]
+            mean = sum(durations) / len(durations)
+            endpoints[label] = {
+                'requests': len(group),
+                'statuses': dict(statuses),
+                'latency_ms': {
+                    **{f'p{percent}': round(percentile(durations, percent), 2)
+                       for percent in PERCENTILES},
+                    'mean': round(mean, 2),
+                    'max': round(durations[-1], 2),
+                },
+                # Пропускная способность одного потока на этом эндпоинте.
+                'rps': round(1000 / mean, 1) if mean else None,
+                'queries_per_request': (
+                    round(sum(queries) / len(queries), 2)
+                    if queries else None),
+            }
+        return endpoints
+
+    def report(self, result, path):
+        for label, endpoint in result['endpoints'].items():
+            latency = endpoint['latency_ms']
+            self.stdout.write(
+                f'{label}: p50 {latency["p50"]} мс, p95 {latency["p95"]} мс, '
+                f'p99 {latency["p99"]} мс, {endpoint["rps"]} запросов/с, '
+                f'SQL-запросов {endpoint["queries_per_request"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Всего {result["requests"]} запросов за {result["duration_s"]} с '
+            f'({result["rps"]} запросов/с), результат в {path}'))
+
+    def compare(self, result, path, max_regression):
+        with open(path, encoding='utf-8') as file:
+            previous = json.load(file)
+        regressions = []
+        for label, endpoint in result['endpoints'].items():
+            old = previous['endpoints'].get(label)
+            if old is None:
+                continue
+            before = old['latency_ms']['p95']
+            after = endpoint['latency_ms']['p95']
+            change = (after - before) / before * 100 if before else 0
+            self.stdout.write(
+                f'{label}: p95 {before} → {after} мс ({change:+.0f}%), '
+                f'SQL-запросов {old["queries_per_request"]} → '
+                f'{endpoint["queries_per_request"]}')
+            if max_regression is not None and change > max_regression:
+                regressions.append(label)
+        if regressions:
+            raise CommandError(
+                f'p95 выросла больше чем на {max_regression}%: '
+                + ', '.join(regressions))
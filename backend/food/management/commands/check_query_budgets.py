@@ -0,0 +1,70 @@
+"""Команда для проверки числа SQL-запросов эндпоинтов API."""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from api import urls as api_urls
+from api.query_budget import (ROUTE_BUDGETS, QueryBudgetExceeded,
+                              assert_constant, get_missing_routes)
+from api.testing import NO_CACHE, Fixture, measure_budget_calls
+
+
+class Command(BaseCommand):
+    """Вызывает маршруты API и сравнивает число запросов с бюджетом.
+    Те же проверки выполняют тесты api.tests; команда печатает
+    число запросов каждого маршрута."""
+
+    help = (
+        'Call every API route with page sizes of 1, 10 and 100 and fail '
+        'when the number of SQL queries exceeds the budget in '
+        'api.query_budget or grows with the page size'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--async-views',
+            action='store_true',
+            help='Call the async read views, as with SERVER_MODE=asgi',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        missing = get_missing_routes(api_urls.urlpatterns)
+        if missing:
+            raise CommandError(
+                'Маршруты без бюджета запросов в api.query_budget: '
+                + ', '.join(sorted(missing)))
+
+        failures = []
+        # Данные создаются в транзакции и откатываются после проверки.
+        # Оценка количества зависит от статистики СУБД и отключена.
+        with override_settings(
+                CACHES=NO_CACHE, PAGINATION_COUNT_ESTIMATE_THRESHOLD=0), \
+                transaction.atomic():
+            for route, label, results in measure_budget_calls(
+                    Fixture(), options['async_views']):
+                counts = {
+                    size: count for size, (_, count) in results.items()}
+                failures += [
+                    f'{label}: ответ {status}'
+                    for status, _ in results.values() if status >= 400]
+                self.stdout.write(
+                    f'{label}: запросов '
+                    + ', '.join(str(count) for count in counts.values())
+                    + f' (бюджет {ROUTE_BUDGETS[route]})')
+                try:
+                    assert_constant(counts, label)
+                    if max(counts.values()) > ROUTE_BUDGETS[route]:
+                        raise QueryBudgetExceeded(
+                            f'{label}: {max(counts.values())} запросов '
+                            f'при бюджете {ROUTE_BUDGETS[route]}')
+                except QueryBudgetExceeded as error:
+                    failures.append(str(error))
+            transaction.set_rollback(True)
+
+        for failure in failures:
+            self.stdout.write(self.style.ERROR(failure))
+        if failures:
+            raise CommandError(f'Превышений бюджета запросов: {len(failures)}')
+        self.stdout.write(self.style.SUCCESS('Бюджеты запросов соблюдены'))
@@ -0,0 +1,101 @@
+"""Команда для проверки планов запросов основных эндпоинтов API."""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import override_settings
+
+from api.testing import (NO_CACHE, capture_selects, explain, find_seq_scans,
+                         get_plan_paths)
+from food.models import Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    """Выполняет запросы эндпоинтов и проверяет их планы через EXPLAIN
+    на данных базы. На тестовых данных ту же проверку делает
+    api.tests.QueryPlanTest."""
+
+    help = (
+        'Run EXPLAIN on the queries issued by the recipe, ingredient and '
+        'subscription endpoints and fail on sequential scans of large tables'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='User id to run the requests as '
+                 '(default: the user with the most subscriptions)',
+        )
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=1000,
+            help='Ignore sequential scans of tables with fewer rows',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        if connection.vendor != 'postgresql':
+            raise CommandError(
+                'Планы запросов проверяются только на PostgreSQL.')
+
+        user = self.get_user(options['user'])
+        recipe = Recipe.objects.order_by('-pub_date').first()
+        if recipe is None:
+            raise CommandError('В базе нет рецептов, заполните её данными.')
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        failures = []
+        with override_settings(CACHES=NO_CACHE):
+            for path in get_plan_paths(recipe):
+                try:
+                    queries = capture_selects(path, user)
+                except AssertionError as error:
+                    raise CommandError(str(error))
+                failures += self.check_queries(
+                    path, queries, options['min_rows'])
+                self.stdout.write(f'{path}: запросов {len(queries)}')
+
+        for path, relation, rows, sql in failures:
+            self.stdout.write(self.style.ERROR(
+                f'{path}: Seq Scan по {relation} (~{rows} строк)\n  {sql}'))
+        if failures:
+            raise CommandError(
+                f'Последовательных чтений больших таблиц: {len(failures)}')
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке'))
+
+    def get_user(self, user_id):
+        if user_id is not None:
+            try:
+                return User.objects.get(pk=user_id)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {user_id} не найден.')
+        user = (
+            User.objects.annotate(subscriptions=Count('following'))
+            .order_by('-subscriptions', 'id').first()
+        )
+        if user is None:
+            raise CommandError('В базе нет пользователей.')
+        return user
+
+    def check_queries(self, path, queries, min_rows):
+        failures = []
+        with connection.cursor() as cursor:
+            for sql in queries:
+                for node in find_seq_scans(explain(sql)):
+                    relation = node['Relation Name']
+                    cursor.execute(
+                        'SELECT reltuples::bigint FROM pg_class '
+                        'WHERE oid = %s::regclass',
+                        [relation],
+                    )
+                    rows = cursor.fetchone()[0]
+                    if rows >= min_rows:
+                        failures.append((path, relation, rows, sql[:300]))
+        return failures
@@ -0,0 +1,41 @@
+"""Команда для заполнения кодов коротких ссылок у старых рецептов."""
+
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from food import short_links
+from food.models import Recipe
+
+
+class Command(BaseCommand):
+    """Записывает коды коротких ссылок рецептам, у которых их нет."""
+
+    help = 'Fill short link codes for recipes that do not have one'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per UPDATE',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        recipe_ids = (
+            Recipe.objects.filter(short_link__isnull=True)
+            .values_list('id', flat=True).iterator()
+        )
+        filled = 0
+        while True:
+            batch = [
+                Recipe(id=recipe_id, short_link=short_links.encode(recipe_id))
+                for recipe_id in islice(recipe_ids, options['batch_size'])
+            ]
+            if not batch:
+                break
+            Recipe.objects.bulk_update(batch, ['short_link'])
+            filled += len(batch)
+        self.stdout.write(
+            self.style.SUCCESS(f'Заполнено коротких ссылок: {filled}'))
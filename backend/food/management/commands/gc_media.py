@@ -0,0 +1,72 @@
+"""Команда для удаления медиафайлов, на которые не ссылается база."""
+
+import posixpath
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from food.images import IMAGE_FIELDS, get_rendition_names, get_renditions_field
+
+
+def walk(storage, directory):
+    """Все файлы каталога хранилища и его подкаталогов."""
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    """Удаляет файлы изображений и копий без ссылок из базы."""
+
+    help = 'Delete image files that are no longer referenced by any record'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age',
+            type=float,
+            default=24,
+            help='Keep files younger than this many hours: they may belong '
+                 'to an upload that is not committed yet',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list the files that would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        referenced = set()
+        directories = set()
+        for model, field in IMAGE_FIELDS:
+            directories.add(model._meta.get_field(field).upload_to)
+            for name, renditions in model.objects.values_list(
+                    field, get_renditions_field(field)).iterator():
+                if name:
+                    referenced.add(name)
+                referenced.update(get_rendition_names(renditions))
+
+        deadline = timezone.now() - timedelta(hours=options['min_age'])
+        deleted = 0
+        for directory in sorted(directories):
+            for name in walk(default_storage, directory.rstrip('/')):
+                if name in referenced:
+                    continue
+                if default_storage.get_modified_time(name) > deadline:
+                    continue
+                if options['dry_run']:
+                    self.stdout.write(name)
+                elif hasattr(default_storage, 'purge'):
+                    default_storage.purge(name)
+                else:
+                    default_storage.delete(name)
+                deleted += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Неиспользуемых файлов: {deleted}, '
+            f'используется {len(referenced)}'))
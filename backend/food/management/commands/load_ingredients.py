@@ -1,39 +1,121 @@
-"""Команда для загрузки ингредиентов из JSON файла."""
+"""Команда для загрузки ингредиентов из CSV или JSON файла."""
 
+import csv
 import json
+import time
+from itertools import islice
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 
+from api.cache import invalidate as invalidate_response_cache
+from api.ingredient_index import invalidate as invalidate_ingredient_index
 from food.models import Ingredient
 
+DEFAULT_PATH = './data/ingredients.csv'
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    """Строки CSV вида «название,единица измерения»."""
+    for row in csv.reader(file):
+        if row:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    """Элементы JSON-массива объектов, без чтения файла целиком."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    eof = False
+    while not eof:
+        chunk = file.read(READ_SIZE)
+        eof = not chunk
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise CommandError('Ожидается JSON-массив ингредиентов.')
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if eof:
+                    raise CommandError('Некорректный JSON с ингредиентами.')
+                break
+            yield item['name'], item['measurement_unit']
+        buffer = buffer[position:]
+    if started:
+        raise CommandError('Некорректный JSON с ингредиентами.')
+
+
+READERS = {'.csv': read_csv, '.json': read_json}
+
 
 class Command(BaseCommand):
-    """Команда для загрузки ингредиентов из JSON файла."""
+    """Команда для загрузки ингредиентов из CSV или JSON файла."""
+
+    help = 'Load ingredients from CSV or JSON file'
 
-    help = 'Load ingredients from JSON file'
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=DEFAULT_PATH,
+            help='Path to ingredients .csv or .json file',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Rows per INSERT',
+        )
 
-    def handle(self, *args, **kwargs):
+    def handle(self, *args, **options):
         """Обрабатывает команду загрузки ингредиентов."""
-        added_count = 0  # Счётчик добавленных ингредиентов
-        existing_count = 0  # Счётчик существующих ингредиентов
-
-        with open('./data/ingredients.json', encoding='utf-8') as f:
-            data = json.load(f)
-
-            for item in data:
-                ingredient, created = Ingredient.objects.get_or_create(
-                    name=item['name'],
-                    measurement_unit=item['measurement_unit']
-                )
-                if created:
-                    added_count += 1
-                    # Увеличиваем счётчик добавленных ингредиентов
-                else:
-                    existing_count += 1
-                    # Увеличиваем счётчик существующих ингредиентов
+        path = Path(options['path'])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        batch_size = options['batch_size']
+
+        started = time.monotonic()
+        total_count = 0
+        existing_before = Ingredient.objects.count()
+
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            rows = reader(file)
+            while True:
+                batch = [
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in islice(rows, batch_size)
+                ]
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+                total_count += len(batch)
+
+        invalidate_ingredient_index()
+        invalidate_response_cache('ingredients')
+        elapsed = time.monotonic() - started
+        added_count = Ingredient.objects.count() - existing_before
 
         # Выводим результаты
         self.stdout.write(
             self.style.SUCCESS(f'Добавлено ингредиентов: {added_count}'))
+        self.stdout.write(self.style.WARNING(
+            f'Существующих ингредиентов: {total_count - added_count}'))
         self.stdout.write(
-            self.style.WARNING(f'Существующих ингредиентов: {existing_count}'))
+            f'Обработано строк: {total_count} за {elapsed:.2f} с '
+            f'({total_count / max(elapsed, 1e-6):.0f} строк/с)')
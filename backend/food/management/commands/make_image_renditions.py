@@ -0,0 +1,36 @@
+"""Команда для построения уменьшенных копий уже загруженных изображений."""
+
+from django.core.management.base import BaseCommand
+
+from food.images import IMAGE_FIELDS, get_renditions_field, process_image
+
+
+class Command(BaseCommand):
+    """Строит копии изображений рецептов и аватаров в текущем процессе."""
+
+    help = 'Build image renditions for recipes and avatars that lack them'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Rebuild renditions that already exist',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        for model, field in IMAGE_FIELDS:
+            renditions_field = get_renditions_field(field)
+            queryset = model.objects.exclude(
+                **{f'{field}__isnull': True}).exclude(**{field: ''})
+            processed = 0
+            for pk, name, renditions in queryset.values_list(
+                    'pk', field, renditions_field).iterator():
+                if (not options['force'] and renditions.get('source') == name
+                        and 'sizes' in renditions):
+                    continue
+                process_image(model._meta.label, pk, field)
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(
+                f'{model._meta.verbose_name_plural}: '
+                f'обработано изображений {processed}'))
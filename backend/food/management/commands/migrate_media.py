@@ -0,0 +1,84 @@
+"""Команда для переименования медиафайлов по хешу содержимого."""
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from api.cache import invalidate as invalidate_response_cache
+from api.fragments import RECIPE_FRAGMENTS
+from food.images import IMAGE_FIELDS, get_renditions_field
+from food.storage import is_content_addressed
+
+
+class Command(BaseCommand):
+    """Сохраняет старые файлы под именами по хешу и обновляет ссылки."""
+
+    help = (
+        'Re-save existing images and renditions under content-addressed '
+        'names; old files are left for gc_media'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report how many files would be migrated',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        self.dry_run = options['dry_run']
+        self.migrated = {}
+        for model, field in IMAGE_FIELDS:
+            renditions_field = get_renditions_field(field)
+            updated = 0
+            queryset = model.objects.exclude(
+                **{f'{field}__isnull': True}).exclude(**{field: ''})
+            for pk, name, renditions in queryset.values_list(
+                    'pk', field, renditions_field).iterator():
+                new_name = self.migrate(name)
+                new_renditions = self.migrate_renditions(renditions)
+                if new_name == name and new_renditions == renditions:
+                    continue
+                if not self.dry_run:
+                    model.objects.filter(pk=pk, **{field: name}).update(**{
+                        field: new_name, renditions_field: new_renditions})
+                updated += 1
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: обновлено {updated}')
+
+        if not self.dry_run:
+            invalidate_response_cache('recipes', RECIPE_FRAGMENTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Файлов под новыми именами: {len(self.migrated)}'))
+
+    def migrate(self, name):
+        """Новое имя файла; сам файл сохраняется, если это не dry-run."""
+        if is_content_addressed(name):
+            return name
+        if name not in self.migrated:
+            if self.dry_run:
+                self.migrated[name] = name
+            else:
+                try:
+                    with default_storage.open(name) as file:
+                        self.migrated[name] = default_storage.save(name, file)
+                except FileNotFoundError:
+                    self.stderr.write(f'Файл не найден: {name}')
+                    self.migrated[name] = name
+        return self.migrated[name]
+
+    def migrate_renditions(self, renditions):
+        if not renditions:
+            return renditions
+        migrated = dict(renditions)
+        if renditions.get('source'):
+            migrated['source'] = self.migrate(renditions['source'])
+        if 'sizes' in renditions:
+            migrated['sizes'] = {
+                rendition: {
+                    image_format: self.migrate(name)
+                    for image_format, name in files.items()
+                }
+                for rendition, files in renditions['sizes'].items()
+            }
+        return migrated
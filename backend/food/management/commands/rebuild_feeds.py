@@ -0,0 +1,24 @@
+"""Команда для пересборки лент подписок."""
+
+from django.core.management.base import BaseCommand
+
+from food import feed
+
+
+class Command(BaseCommand):
+    """Пересобирает FeedEntry из подписок и рецептов."""
+
+    help = 'Rebuild subscription feeds from follows and recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='Limit the command to one user id',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        entries = feed.rebuild(options['user'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах подписок: {entries}'))
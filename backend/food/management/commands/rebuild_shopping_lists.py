@@ -0,0 +1,51 @@
+"""Команда для пересборки и проверки агрегированных списков покупок."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from food import shopping_list
+
+
+class Command(BaseCommand):
+    """Пересобирает ShoppingListItem из корзин или сверяет с ними."""
+
+    help = 'Rebuild or verify shopping list aggregates against carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only compare the aggregate with the live GROUP BY',
+        )
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='Limit the command to one user id',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        user_id = options['user']
+
+        if not options['verify']:
+            rows = shopping_list.rebuild(user_id)
+            self.stdout.write(self.style.SUCCESS(
+                f'Пересобрано строк списка покупок: {rows}'))
+            return
+
+        live = shopping_list.get_live_amounts(user_id)
+        stored = shopping_list.get_stored_amounts(user_id)
+        mismatches = [
+            key for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        ]
+        for user, ingredient in sorted(mismatches)[:20]:
+            self.stdout.write(
+                f'user={user} ingredient={ingredient}: '
+                f'ожидается {live.get((user, ingredient))}, '
+                f'сохранено {stored.get((user, ingredient))}'
+            )
+        if mismatches:
+            raise CommandError(
+                f'Расхождений в списках покупок: {len(mismatches)}')
+        self.stdout.write(
+            self.style.SUCCESS(f'Списки покупок совпадают: {len(live)} строк'))
@@ -0,0 +1,47 @@
+"""Команда для сверки счётчиков избранного и корзин у рецептов."""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from food import recipe_counters
+
+
+class Command(BaseCommand):
+    """Пересчитывает favorites_count и in_carts_count по строкам
+    избранного и корзин или только сверяет их."""
+
+    help = 'Recalculate or verify recipe favorites and cart counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only report recipes whose counters do not match',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Recipes per UPDATE',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        if not options['verify']:
+            fixed = recipe_counters.reconcile(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Исправлено счётчиков рецептов: {fixed}'))
+            return
+
+        fields = list(recipe_counters.COUNTERS)
+        mismatched = recipe_counters.get_mismatched().values(
+            'id', *fields, *(f'live_{field}' for field in fields))
+        count = 0
+        for recipe in mismatched.order_by('id').iterator():
+            count += 1
+            if count <= 20:
+                self.stdout.write(f'recipe={recipe["id"]}: ' + ', '.join(
+                    f'{field} {recipe[field]}, ожидается '
+                    f'{recipe[f"live_{field}"]}' for field in fields))
+        if count:
+            raise CommandError(f'Расхождений в счётчиках рецептов: {count}')
+        self.stdout.write(self.style.SUCCESS('Счётчики рецептов совпадают'))
@@ -0,0 +1,114 @@
+"""Команда для выполнения фоновых задач из очереди food.jobs."""
+
+import json
+import multiprocessing
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from food import jobs
+
+
+def work(stop_event, poll_interval, burst):
+    """Цикл воркера в отдельном потоке или процессе."""
+    worker = jobs.Worker(stop_event, poll_interval, burst)
+    try:
+        worker.run()
+    finally:
+        # Соединения с БД у каждого потока свои.
+        connections.close_all()
+
+
+def work_in_process(stop_event, poll_interval, burst):
+    # Процесс останавливается по общему событию, а не по сигналу,
+    # чтобы дописать текущую задачу.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    work(stop_event, poll_interval, burst)
+
+
+class Command(BaseCommand):
+    """Запускает пул воркеров, которые выполняют задачи очереди."""
+
+    help = (
+        'Run a pool of workers that execute queued background jobs; '
+        'SIGTERM or Ctrl+C stops them after the current job'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.BACKGROUND_WORKERS,
+            help='Number of workers',
+        )
+        parser.add_argument(
+            '--processes',
+            action='store_true',
+            help='Run workers as processes instead of threads',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=1.0,
+            help='Seconds to wait when the queue is empty',
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit when there are no jobs ready to run',
+        )
+        parser.add_argument(
+            '--stats',
+            action='store_true',
+            help='Print queue statistics as JSON and exit',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        if options['stats']:
+            self.stdout.write(json.dumps(jobs.get_stats(), indent=2))
+            return
+
+        count = max(options['workers'], 1)
+        worker_args = (options['poll_interval'], options['burst'])
+        if options['processes']:
+            stop_event = multiprocessing.Event()
+            # Дочерние процессы не должны наследовать открытые соединения.
+            connections.close_all()
+            pool = [
+                multiprocessing.Process(
+                    target=work_in_process,
+                    args=(stop_event, *worker_args),
+                    name=f'worker-{number}')
+                for number in range(count)
+            ]
+        else:
+            stop_event = threading.Event()
+            pool = [
+                threading.Thread(
+                    target=work,
+                    args=(stop_event, *worker_args),
+                    name=f'worker-{number}')
+                for number in range(count)
+            ]
+
+        def stop(signum, frame):
+            self.stdout.write('Остановка воркеров после текущих задач...')
+            stop_event.set()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        kind = 'процессов' if options['processes'] else 'потоков'
+        self.stdout.write(f'Запущено воркеров: {count} ({kind})')
+        for worker in pool:
+            worker.start()
+        for worker in pool:
+            # join с таймаутом, чтобы главный поток получал сигналы.
+            while worker.is_alive():
+                worker.join(1)
+        self.stdout.write(self.style.SUCCESS('Воркеры остановлены'))
@@ -0,0 +1,188 @@
+"""Команда для заполнения базы данными для нагрузочных тестов."""
+
+import io
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from PIL import Image
+
+from api.cache import invalidate as invalidate_response_cache
+from api.counts import COUNTS
+from api.fragments import RECIPE_FRAGMENTS
+from food import follower_counters, shopping_list
+from food.management.commands.load_ingredients import \
+    DEFAULT_PATH as INGREDIENTS_PATH
+from food.models import (Favorite, Follow, Ingredient, Recipe,
+                         RecipeIngredient, ShoppingCart, Tag)
+
+User = get_user_model()
+
+EMAIL = 'bench-{number}@example.com'
+USERNAME = 'bench-{number}'
+DEFAULT_PASSWORD = 'benchmark-password'
+BATCH_SIZE = 1000
+
+
+def make_image():
+    """Одно изображение на все рецепты: хранилище запишет его один раз."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (600, 400), (200, 120, 60)).save(buffer, 'JPEG')
+    return default_storage.save(
+        'dishes/benchmark.jpg', ContentFile(buffer.getvalue()))
+
+
+def sample_pairs(rng, left_ids, right_ids, per_left, exclude_self=False):
+    """Случайные неповторяющиеся пары (левый id, правый id)."""
+    for left in left_ids:
+        choices = rng.sample(right_ids, min(per_left, len(right_ids)))
+        for right in choices:
+            if not (exclude_self and left == right):
+                yield left, right
+
+
+def bulk_create(model, objects):
+    return model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+class Command(BaseCommand):
+    """Создаёт пользователей, рецепты, подписки, избранное и корзины."""
+
+    help = (
+        'Seed users, recipes, follows, favorites and shopping carts '
+        'for load testing (see the benchmark command)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=6,
+                            help='Minimum number of tags')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--tags-per-recipe', type=int, default=2)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Subscriptions per user')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Favorite recipes per user')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Recipes in the shopping cart per user')
+        parser.add_argument('--password', default=DEFAULT_PASSWORD,
+                            help='Password of the seeded users')
+        parser.add_argument('--ingredients-path', default=INGREDIENTS_PATH,
+                            help='File for the load_ingredients command')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Random seed, for a reproducible dataset')
+        parser.add_argument(
+            '--flush',
+            action='store_true',
+            help='Delete previously seeded users and their recipes first',
+        )
+
+    def handle(self, *args, **options):
+        """Обрабатывает команду."""
+        seeded = User.objects.filter(email__endswith='@example.com',
+                                     username__startswith='bench-')
+        if seeded.exists():
+            if not options['flush']:
+                raise CommandError(
+                    'Данные для нагрузочных тестов уже созданы. '
+                    'Запустите команду с --flush, чтобы создать их заново.')
+            seeded.delete()
+
+        started = time.monotonic()
+        rng = random.Random(options['seed'])
+        call_command('load_ingredients', options['ingredients_path'],
+                     stdout=self.stdout)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError('Справочник ингредиентов пуст.')
+
+        with transaction.atomic():
+            tag_ids = self.create_tags(options['tags'])
+            user_ids = self.create_users(options['users'],
+                                         options['password'])
+            recipe_ids = self.create_recipes(
+                rng, options['recipes'], user_ids, make_image())
+            bulk_create(RecipeIngredient, (
+                RecipeIngredient(recipe_id=recipe, ingredient_id=ingredient,
+                                 amount=rng.randint(1, 500))
+                for recipe, ingredient in sample_pairs(
+                    rng, recipe_ids, ingredient_ids,
+                    options['ingredients_per_recipe'])
+            ))
+            bulk_create(Recipe.tags.through, (
+                Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                for recipe, tag in sample_pairs(
+                    rng, recipe_ids, tag_ids, options['tags_per_recipe'])
+            ))
+            bulk_create(Follow, (
+                Follow(user_id=user, following_id=author)
+                for user, author in sample_pairs(
+                    rng, user_ids, user_ids, options['follows'],
+                    exclude_self=True)
+            ))
+            bulk_create(Favorite, (
+                Favorite(user_id=user, recipe_id=recipe)
+                for user, recipe in sample_pairs(
+                    rng, user_ids, recipe_ids, options['favorites'])
+            ))
+            # bulk_create не вызывает сигналы, списки покупок, счётчики
+            # рецептов и подписчиков пересчитываются ниже.
+            bulk_create(ShoppingCart, (
+                ShoppingCart(user_id=user, recipe_id=recipe)
+                for user, recipe in sample_pairs(
+                    rng, user_ids, recipe_ids, options['cart'])
+            ))
+
+        shopping_list.rebuild()
+        call_command('reconcile_recipe_counters', stdout=self.stdout)
+        follower_counters.reconcile()
+        call_command('fill_short_links', stdout=self.stdout)
+        invalidate_response_cache(
+            'recipes', 'tags', 'ingredients', RECIPE_FRAGMENTS, COUNTS)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(user_ids)}, рецептов: '
+            f'{len(recipe_ids)} за {time.monotonic() - started:.1f} с. '
+            f'Вход: {EMAIL.format(number=0)} / {options["password"]}'))
+
+    def create_tags(self, count):
+        existing = Tag.objects.count()
+        bulk_create(Tag, (
+            Tag(name=f'Тег {number}', slug=f'bench-tag-{number}')
+            for number in range(existing, count)
+        ))
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_users(self, count, password):
+        # Хеш пароля дорогой, он считается один раз на всех.
+        password = make_password(password)
+        users = bulk_create(User, (
+            User(
+                email=EMAIL.format(number=number),
+                username=USERNAME.format(number=number),
+                first_name='Пользователь',
+                last_name=str(number),
+                password=password,
+            )
+            for number in range(count)
+        ))
+        return [user.id for user in users]
+
+    def create_recipes(self, rng, count, user_ids, image):
+        recipes = bulk_create(Recipe, (
+            Recipe(
+                author_id=rng.choice(user_ids),
+                name=f'Рецепт {number}',
+                text='Описание рецепта для нагрузочного теста.',
+                cooking_time=rng.randint(1, 180),
+                image=image,
+            )
+            for number in range(count)
+        ))
+        return [recipe.id for recipe in recipes]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.20 on 2026-10-18 07:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0026_cookuser_avatar_renditions_recipe_image_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='short_link',
+            field=models.CharField(blank=True, max_length=12, null=True, unique=True, verbose_name='Хеш для короткой ссылки'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.20 on 2026-10-18 09:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('food', 'Recipe')
+    counters = {
+        'favorites_count': apps.get_model('food', 'Favorite'),
+        'in_carts_count': apps.get_model('food', 'ShoppingCart'),
+    }
+    Recipe.objects.update(**{
+        field: Coalesce(
+            Subquery(
+                model.objects.filter(recipe=OuterRef('pk')).order_by()
+                .values('recipe').annotate(total=Count('pk'))
+                .values('total')
+            ),
+            Value(0),
+        )
+        for field, model in counters.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0027_alter_recipe_short_link'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-in_carts_count', '-pub_date', '-id'], name='recipe_popular_idx'),
+        ),
+    ]
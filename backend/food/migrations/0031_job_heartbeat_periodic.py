@@ -0,0 +1,36 @@
+# Generated by Django 4.2.20 on 2026-10-18 14:20
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_heartbeats(apps, schema_editor):
+    """Выполняющимся задачам — сигнал с момента их начала."""
+    Job = apps.get_model('food', 'Job')
+    Job.objects.filter(heartbeat_at__isnull=True).update(
+        heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0030_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последний сигнал воркера'),
+        ),
+        migrations.AddField(
+            model_name='job',
+            name='periodic',
+            field=models.BooleanField(default=False, verbose_name='Периодическая'),
+        ),
+        migrations.RunPython(fill_heartbeats, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='job',
+            constraint=models.UniqueConstraint(condition=models.Q(('periodic', True), ('status__in', ['queued', 'running'])), fields=('name',), name='unique_active_periodic_job'),
+        ),
+    ]
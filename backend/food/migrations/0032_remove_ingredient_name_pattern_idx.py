@@ -0,0 +1,17 @@
+# Generated by Django 4.2.20 on 2026-10-18 16:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0031_job_heartbeat_periodic'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='ingredient',
+            name='ingredient_name_pattern_idx',
+        ),
+    ]
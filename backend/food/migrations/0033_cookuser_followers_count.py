@@ -0,0 +1,39 @@
+# Generated by Django 4.2.20 on 2026-10-18 17:30
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_followers_count(apps, schema_editor):
+    """Счётчики по существующим подпискам."""
+    CookUser = apps.get_model('food', 'CookUser')
+    Follow = apps.get_model('food', 'Follow')
+    CookUser.objects.update(followers_count=Coalesce(
+        Subquery(
+            Follow.objects.filter(following=OuterRef('pk')).order_by()
+            .values('following').annotate(total=Count('pk'))
+            .values('total')
+        ),
+        Value(0),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('food', '0032_remove_ingredient_name_pattern_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cookuser',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.RunPython(fill_followers_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cookuser',
+            index=models.Index(fields=['followers_count'], name='user_followers_count_idx'),
+        ),
+    ]
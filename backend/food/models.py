@@ -2,6 +2,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.utils import timezone
 
 from food.constants import (MAX_AMOUNT, MAX_LENGTH_FIELD_STR, MAX_LENGTH_TITLE,
                             MIN_AMOUNT)
@@ -23,11 +24,24 @@ class CookUser(AbstractUser):
         null=True,
         blank=True,
     )
+    avatar_renditions = models.JSONField(
+        "Уменьшенные копии аватара",
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+    # Поддерживается сигналами подписок (food.follower_counters).
+    followers_count = models.PositiveIntegerField(
+        "Подписчиков", default=0, editable=False)
 
     class Meta:
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
         ordering = ["username"]
+        indexes = [
+            models.Index(
+                fields=["followers_count"], name="user_followers_count_idx"),
+        ]
 
     def __str__(self):
         return self.username[:MAX_LENGTH_FIELD_STR]
@@ -112,11 +126,21 @@ class Recipe(models.Model):
         null=True,
         blank=True
     )
+    image_renditions = models.JSONField(
+        "Уменьшенные копии изображения",
+        default=dict,
+        blank=True,
+        editable=False,
+    )
     text = models.TextField("Описание рецепта")
     pub_date = models.DateTimeField(
         "Дата публикации",
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        "Дата изменения",
+        auto_now=True
+    )
 
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -133,17 +157,34 @@ class Recipe(models.Model):
 
     short_link = models.CharField(
         "Хеш для короткой ссылки",
-        max_length=6,
+        max_length=12,
         unique=True,
         null=True,
         blank=True,
     )
+    # Счётчики поддерживаются сигналами избранного и корзины
+    # и сверяются командой reconcile_recipe_counters.
+    favorites_count = models.PositiveIntegerField(
+        "В избранном", default=0, editable=False)
+    in_carts_count = models.PositiveIntegerField(
+        "В корзинах", default=0, editable=False)
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         default_related_name = "recipes"
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"], name="recipe_pub_date_id_idx"),
+            models.Index(
+                fields=["author", "-pub_date"],
+                name="recipe_author_pub_date_idx"),
+            models.Index(
+                fields=["-favorites_count", "-in_carts_count", "-pub_date",
+                        "-id"],
+                name="recipe_popular_idx"),
+        ]
 
     def __str__(self):
         return self.name[:MAX_LENGTH_FIELD_STR]
@@ -229,3 +270,155 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"{self.user} {self.recipe}"
+
+
+class ShoppingListItem(models.Model):
+    """Суммарное количество ингредиента в списке покупок пользователя.
+
+    Поддерживается при добавлении и удалении рецептов из корзины и при
+    изменении ингредиентов рецептов, чтобы выгрузка списка покупок
+    не пересчитывала GROUP BY по всей корзине.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list",
+        verbose_name="Пользователь"
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_items",
+        verbose_name="Ингредиент"
+    )
+    amount = models.IntegerField("Количество")
+    updated_at = models.DateTimeField("Дата изменения", auto_now=True)
+
+    class Meta:
+        ordering = ["user"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "ingredient"],
+                name="unique_shopping_list_item"
+            )
+        ]
+        verbose_name = "Ингредиент в списке покупок"
+        verbose_name_plural = "Список покупок"
+
+    def __str__(self):
+        return f"{self.user} {self.ingredient} {self.amount}"
+
+
+class FeedEntry(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Записи создаются при публикации рецепта для каждого подписчика
+    автора (food.feed), чтобы лента читалась по индексу одного
+    пользователя, а не соединением подписок с рецептами.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="feed",
+        verbose_name="Пользователь"
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="feed_entries",
+        verbose_name="Рецепт"
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="Автор"
+    )
+    pub_date = models.DateTimeField("Дата публикации")
+
+    class Meta:
+        ordering = ["user", "-pub_date", "-recipe"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "recipe"],
+                name="unique_feed_entry"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-recipe"],
+                name="feed_entry_user_pub_date_idx"),
+            models.Index(
+                fields=["user", "author"], name="feed_entry_user_author_idx"),
+        ]
+        verbose_name = "Запись ленты подписок"
+        verbose_name_plural = "Ленты подписок"
+
+    def __str__(self):
+        return f"{self.user} {self.recipe}"
+
+
+class Job(models.Model):
+    """Фоновая задача в очереди food.jobs.
+
+    Задачи выполняет команда run_workers. Запись создаётся в той же
+    транзакции, что и данные, для которых она поставлена, поэтому
+    воркер не увидит задачу раньше этих данных.
+    """
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "В очереди"
+        RUNNING = "running", "Выполняется"
+        DONE = "done", "Выполнена"
+        FAILED = "failed", "Ошибка"
+
+    name = models.CharField("Задача", max_length=255)
+    args = models.JSONField("Аргументы", default=list, blank=True)
+    priority = models.SmallIntegerField("Приоритет", default=0)
+    status = models.CharField(
+        "Состояние",
+        max_length=16,
+        choices=Status.choices,
+        default=Status.QUEUED,
+    )
+    attempts = models.PositiveSmallIntegerField("Попыток", default=0)
+    max_attempts = models.PositiveSmallIntegerField("Наибольшее число попыток")
+    run_at = models.DateTimeField("Выполнить после", default=timezone.now)
+    created_at = models.DateTimeField("Создана", auto_now_add=True)
+    started_at = models.DateTimeField("Начата", null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        "Последний сигнал воркера", null=True, blank=True)
+    finished_at = models.DateTimeField("Завершена", null=True, blank=True)
+    locked_by = models.CharField("Воркер", max_length=255, blank=True)
+    periodic = models.BooleanField("Периодическая", default=False)
+    duration = models.FloatField("Длительность, с", null=True, blank=True)
+    error = models.TextField("Ошибка", blank=True)
+
+    class Meta:
+        ordering = ["-id"]
+        indexes = [
+            # Выбор следующей задачи воркером.
+            models.Index(
+                fields=["status", "-priority", "run_at", "id"],
+                name="job_queue_idx"),
+            # Последний запуск периодической задачи.
+            models.Index(
+                fields=["name", "-created_at"], name="job_name_created_idx"),
+        ]
+        constraints = [
+            # Периодическая задача не ставится второй раз, пока прошлый
+            # запуск в очереди или выполняется, даже если её ставят
+            # несколько воркеров одновременно.
+            models.UniqueConstraint(
+                fields=["name"],
+                condition=models.Q(
+                    periodic=True, status__in=["queued", "running"]),
+                name="unique_active_periodic_job"),
+        ]
+        verbose_name = "Фоновая задача"
+        verbose_name_plural = "Фоновые задачи"
+
+    def __str__(self):
+        return f"{self.name} #{self.id} ({self.status})"
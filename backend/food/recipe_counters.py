@@ -0,0 +1,72 @@
+"""Счётчики избранного и корзин у рецептов.
+
+Recipe.favorites_count и Recipe.in_carts_count меняются одним UPDATE
+с F() при добавлении и удалении строк Favorite и ShoppingCart, поэтому
+параллельные запросы не теряют изменений. Записи в обход сигналов
+(bulk_create, загрузка дампа) исправляет reconcile.
+"""
+
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from food.models import Favorite, Recipe, ShoppingCart
+
+# Поле счётчика и модель, строки которой оно считает.
+COUNTERS = {
+    "favorites_count": Favorite,
+    "in_carts_count": ShoppingCart,
+}
+
+
+def change(recipe_id, field, delta):
+    """Прибавляет delta к счётчику рецепта, не опуская его ниже нуля."""
+    recipes = Recipe.objects.filter(pk=recipe_id)
+    if delta < 0:
+        recipes = recipes.filter(**{f"{field}__gte": -delta})
+    recipes.update(**{field: F(field) + delta})
+
+
+def get_live_count(model):
+    """Выражение с числом строк model для каждого рецепта."""
+    return Coalesce(
+        Subquery(
+            model.objects.filter(recipe=OuterRef("pk")).order_by()
+            .values("recipe").annotate(total=Count("pk")).values("total")
+        ),
+        Value(0),
+    )
+
+
+def get_mismatched(recipes=None):
+    """Рецепты, у которых хотя бы один счётчик расходится со строками."""
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    live = {
+        f"live_{field}": get_live_count(model)
+        for field, model in COUNTERS.items()
+    }
+    condition = Q()
+    for field in COUNTERS:
+        condition |= ~Q(**{field: F(f"live_{field}")})
+    return recipes.annotate(**live).filter(condition)
+
+
+def reconcile(batch_size=1000):
+    """Пересчитывает счётчики по диапазонам id, по batch_size рецептов
+    за UPDATE. Возвращает число исправленных рецептов."""
+    fixed = 0
+    last_id = 0
+    while True:
+        ids = list(
+            Recipe.objects.filter(id__gt=last_id).order_by("id")
+            .values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return fixed
+        last_id = ids[-1]
+        batch = Recipe.objects.filter(id__gte=ids[0], id__lte=last_id)
+        fixed += Recipe.objects.filter(
+            pk__in=get_mismatched(batch).values("pk")
+        ).update(**{
+            field: get_live_count(model)
+            for field, model in COUNTERS.items()
+        })
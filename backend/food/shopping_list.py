@@ -0,0 +1,155 @@
+"""Поддержка агрегированного списка покупок (ShoppingListItem).
+
+Изменения списка пользователя и его пересборка блокируют строку
+пользователя (SELECT ... FOR UPDATE), поэтому выполняются по очереди.
+Изменение корзины должно идти в той же транзакции, что и правка списка:
+тогда пересборка видит либо оба изменения, либо ни одного.
+"""
+
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from food.models import RecipeIngredient, ShoppingCart, ShoppingListItem
+
+User = get_user_model()
+
+
+def lock_users(users):
+    """Блокирует строки пользователей до конца транзакции. Порядок
+    по id исключает взаимные блокировки."""
+    list(users.select_for_update().order_by("id").values_list(
+        "id", flat=True))
+
+
+def get_recipe_amounts(recipe_id):
+    """Количество каждого ингредиента рецепта: {ingredient_id: amount}."""
+    return dict(
+        RecipeIngredient.objects.filter(recipe_id=recipe_id)
+        .values_list("ingredient_id", "amount")
+    )
+
+
+def apply_amounts(user_ids, deltas):
+    """Прибавляет deltas ({ingredient_id: delta}) к спискам покупок
+    пользователей и удаляет обнулившиеся строки."""
+    deltas = {
+        ingredient_id: delta
+        for ingredient_id, delta in deltas.items() if delta
+    }
+    user_ids = list(user_ids)
+    if not user_ids or not deltas:
+        return
+
+    by_delta = defaultdict(list)
+    for ingredient_id, delta in deltas.items():
+        by_delta[delta].append(ingredient_id)
+
+    with transaction.atomic():
+        lock_users(User.objects.filter(id__in=user_ids))
+        ShoppingListItem.objects.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=0)
+                for user_id in user_ids
+                for ingredient_id, delta in deltas.items() if delta > 0
+            ],
+            ignore_conflicts=True,
+        )
+        now = timezone.now()
+        for delta, ingredient_ids in by_delta.items():
+            ShoppingListItem.objects.filter(
+                user_id__in=user_ids, ingredient_id__in=ingredient_ids
+            ).update(amount=F("amount") + delta, updated_at=now)
+        ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas, amount__lte=0
+        ).delete()
+
+
+def add_recipe(user_id, recipe_id):
+    """Добавляет ингредиенты рецепта в список покупок пользователя."""
+    apply_amounts([user_id], get_recipe_amounts(recipe_id))
+
+
+def remove_recipe(user_id, recipe_id):
+    """Вычитает ингредиенты рецепта из списка покупок пользователя."""
+    apply_amounts(
+        [user_id],
+        {
+            ingredient_id: -amount
+            for ingredient_id, amount in get_recipe_amounts(recipe_id).items()
+        },
+    )
+
+
+def update_recipe(recipe_id, old_amounts, new_amounts):
+    """Переносит изменение ингредиентов рецепта во все корзины с ним."""
+    deltas = {
+        ingredient_id: (
+            new_amounts.get(ingredient_id, 0)
+            - old_amounts.get(ingredient_id, 0))
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()
+    }
+    if not any(deltas.values()):
+        return
+    apply_amounts(
+        ShoppingCart.objects.filter(recipe_id=recipe_id)
+        .values_list("user_id", flat=True),
+        deltas,
+    )
+
+
+def get_live_amounts(user_id=None):
+    """Список покупок, посчитанный GROUP BY по корзинам:
+    {(user_id, ingredient_id): amount}."""
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_recipe__isnull=False)
+    if user_id is not None:
+        rows = rows.filter(recipe__shopping_recipe__user_id=user_id)
+    rows = (
+        rows.values("recipe__shopping_recipe__user_id", "ingredient_id")
+        .annotate(total=Sum("amount"))
+        .order_by()
+    )
+    return {
+        (row["recipe__shopping_recipe__user_id"], row["ingredient_id"]):
+            row["total"]
+        for row in rows
+    }
+
+
+def get_stored_amounts(user_id=None):
+    """Содержимое ShoppingListItem: {(user_id, ingredient_id): amount}."""
+    rows = ShoppingListItem.objects.all()
+    if user_id is not None:
+        rows = rows.filter(user_id=user_id)
+    return {
+        (user, ingredient): amount
+        for user, ingredient, amount in rows.values_list(
+            "user_id", "ingredient_id", "amount")
+    }
+
+
+def rebuild(user_id=None, batch_size=1000):
+    """Пересобирает список покупок из корзин. Возвращает число строк."""
+    with transaction.atomic():
+        users = User.objects.all()
+        stored = ShoppingListItem.objects.all()
+        if user_id is not None:
+            users = users.filter(id=user_id)
+            stored = stored.filter(user_id=user_id)
+        lock_users(users)
+        amounts = get_live_amounts(user_id)
+        stored.delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user, ingredient_id=ingredient, amount=amount)
+                for (user, ingredient), amount in amounts.items()
+            ),
+            batch_size=batch_size,
+        )
+    return len(amounts)
@@ -0,0 +1,140 @@
+"""Короткие ссылки на рецепты.
+
+Код рецепта вычисляется из его id: id умножается на число, взаимно
+простое с 62^7, по модулю 62^7 и записывается семью символами base62.
+Это перестановка, поэтому коды разных рецептов не совпадают, а соседние
+id дают непохожие коды. Старые коды из цифр id короче семи символов
+и с новыми не пересекаются. Для id от 62^7 код — просто id в base62,
+он длиннее семи символов.
+
+Код рецепта не меняется, поэтому соответствие кода и id кешируется
+в памяти процесса (LRU) и в общем кеше надолго.
+"""
+
+import string
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from food.models import Recipe
+
+ALPHABET = string.digits + string.ascii_letters
+BASE = len(ALPHABET)
+CODE_LENGTH = 7
+MODULUS = BASE ** CODE_LENGTH
+MULTIPLIER = 2654435761
+INVERSE = pow(MULTIPLIER, -1, MODULUS)
+
+CACHE_KEY = "short_link:{code}"
+
+
+def _to_base62(number, length=1):
+    digits = []
+    while number:
+        number, digit = divmod(number, BASE)
+        digits.append(ALPHABET[digit])
+    return "".join(reversed(digits)).rjust(length, ALPHABET[0])
+
+
+def encode(recipe_id):
+    """Код короткой ссылки для id рецепта."""
+    if recipe_id < MODULUS:
+        return _to_base62(recipe_id * MULTIPLIER % MODULUS, CODE_LENGTH)
+    return _to_base62(recipe_id)
+
+
+def decode(code):
+    """id рецепта по коду из encode или None для других строк."""
+    if len(code) < CODE_LENGTH or any(char not in ALPHABET for char in code):
+        return None
+    number = 0
+    for char in code:
+        number = number * BASE + ALPHABET.index(char)
+    if len(code) == CODE_LENGTH:
+        return number * INVERSE % MODULUS
+    return number if number >= MODULUS else None
+
+
+class _LRU:
+    """Словарь ограниченного размера, вытесняющий давно не читанное."""
+
+    def __init__(self, size):
+        self.size = size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+_recent = _LRU(settings.SHORT_LINK_LRU_SIZE)
+
+
+def _get_ids(code):
+    # Рецепты, которым код ещё не записан, находятся по id из кода.
+    condition = Q(short_link=code)
+    recipe_id = decode(code)
+    if recipe_id is not None:
+        condition |= Q(id=recipe_id, short_link__isnull=True)
+    return Recipe.objects.filter(condition).values_list("id", flat=True)
+
+
+def _lookup(code):
+    return _get_ids(code).first()
+
+
+def resolve(code):
+    """id рецепта по коду: из памяти процесса, общего кеша или БД."""
+    recipe_id = _recent.get(code)
+    if recipe_id is not None:
+        return recipe_id
+    key = CACHE_KEY.format(code=code)
+    recipe_id = cache.get(key)
+    if recipe_id is None:
+        recipe_id = _lookup(code)
+        if recipe_id is None:
+            return None
+        cache.set(key, recipe_id, settings.SHORT_LINK_CACHE_TIMEOUT)
+    _recent.set(code, recipe_id)
+    return recipe_id
+
+
+async def aresolve(code):
+    """resolve для асинхронных представлений."""
+    recipe_id = _recent.get(code)
+    if recipe_id is not None:
+        return recipe_id
+    key = CACHE_KEY.format(code=code)
+    recipe_id = await cache.aget(key)
+    if recipe_id is None:
+        recipe_id = await _get_ids(code).afirst()
+        if recipe_id is None:
+            return None
+        await cache.aset(key, recipe_id, settings.SHORT_LINK_CACHE_TIMEOUT)
+    _recent.set(code, recipe_id)
+    return recipe_id
+
+
+def forget(code):
+    """Убирает код удалённого рецепта из кешей этого процесса и общего.
+    Другие процессы хранят его до вытеснения из LRU."""
+    _recent.pop(code)
+    cache.delete(CACHE_KEY.format(code=code))
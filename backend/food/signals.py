@@ -0,0 +1,111 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from food import (feed, follower_counters, jobs, recipe_counters,
+                  shopping_list, short_links)
+from food.images import schedule_renditions
+from food.models import Favorite, Follow, Recipe, ShoppingCart
+
+User = get_user_model()
+
+COUNTER_FIELDS = {
+    model: field for field, model in recipe_counters.COUNTERS.items()}
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_to_shopping_list(sender, instance, created, **kwargs):
+    """Прибавляет ингредиенты рецепта к списку покупок."""
+    if created:
+        shopping_list.add_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_recipe_from_shopping_list(sender, instance, **kwargs):
+    """Вычитает ингредиенты рецепта из списка покупок.
+
+    pre_delete, а не post_delete: при каскадном удалении рецепта его
+    ингредиенты к этому моменту ещё не удалены.
+    """
+    shopping_list.remove_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def increment_recipe_counter(sender, instance, created, **kwargs):
+    """Увеличивает счётчик избранного или корзин рецепта."""
+    if created:
+        recipe_counters.change(
+            instance.recipe_id, COUNTER_FIELDS[sender], 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def decrement_recipe_counter(sender, instance, **kwargs):
+    """Уменьшает счётчик избранного или корзин рецепта."""
+    recipe_counters.change(instance.recipe_id, COUNTER_FIELDS[sender], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_recipe_image_renditions(sender, instance, **kwargs):
+    """Готовит уменьшенные копии нового изображения рецепта."""
+    schedule_renditions(instance, "image")
+
+
+@receiver(post_save, sender=User)
+def schedule_avatar_renditions(sender, instance, **kwargs):
+    """Готовит уменьшенные копии нового аватара."""
+    schedule_renditions(instance, "avatar")
+
+
+@receiver(post_save, sender=Recipe)
+def assign_short_link(sender, instance, created, **kwargs):
+    """Записывает код короткой ссылки новому рецепту."""
+    if created and not instance.short_link:
+        instance.short_link = short_links.encode(instance.id)
+        Recipe.objects.filter(pk=instance.pk).update(
+            short_link=instance.short_link)
+
+
+@receiver(post_delete, sender=Recipe)
+def forget_short_link(sender, instance, **kwargs):
+    """Короткая ссылка удалённого рецепта больше не ведёт на него.
+    Рецепт без записанного кода находился по коду из id."""
+    for code in {instance.short_link, short_links.encode(instance.id)}:
+        if code:
+            short_links.forget(code)
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    """Раскладывает новый рецепт по лентам подписчиков автора."""
+    if created:
+        jobs.enqueue(feed.fan_out, instance.id)
+
+
+@receiver(post_save, sender=Follow)
+def increment_followers_count(sender, instance, created, **kwargs):
+    """Увеличивает счётчик подписчиков автора."""
+    if created and instance.following_id:
+        follower_counters.change(instance.following_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def decrement_followers_count(sender, instance, **kwargs):
+    """Уменьшает счётчик подписчиков автора."""
+    if instance.following_id:
+        follower_counters.change(instance.following_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def add_author_to_feed(sender, instance, created, **kwargs):
+    """Добавляет рецепты автора в ленту нового подписчика."""
+    if created:
+        jobs.enqueue(
+            feed.add_author, instance.user_id, instance.following_id)
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_feed(sender, instance, **kwargs):
+    """Убирает рецепты автора из ленты отписавшегося пользователя."""
+    feed.remove_author(instance.user_id, instance.following_id)
@@ -0,0 +1,79 @@
+"""Хранилище медиафайлов с именами по содержимому.
+
+Файл сохраняется как <каталог>/<xx>/<sha256><расширение>, где каталог
+берётся из upload_to поля, а xx — первые два символа хеша. Одинаковые
+загрузки получают одно имя и записываются один раз, а содержимое файла
+с данным именем никогда не меняется, поэтому nginx отдаёт такие файлы
+с заголовком immutable.
+
+Файл пишется во временный рядом и переименовывается, поэтому
+параллельные загрузки одного содержимого не получают имя с суффиксом,
+а читатели не видят файл недописанным.
+
+Один файл может быть у нескольких записей, поэтому delete() ничего не
+удаляет: неиспользуемые файлы и оставшиеся временные убирает команда
+gc_media.
+"""
+
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+CONTENT_ADDRESSED_NAME_RE = re.compile(
+    r"(?:.+/)?(?P<prefix>[0-9a-f]{2})/(?P=prefix)[0-9a-f]{62}(?:\.\w+)?")
+
+
+def is_content_addressed(name):
+    """Имя файла уже построено по хешу содержимого."""
+    return CONTENT_ADDRESSED_NAME_RE.fullmatch(name) is not None
+
+
+def get_content_name(name, content):
+    """Имя файла по хешу содержимого в каталоге исходного имени."""
+    digest = hashlib.sha256()
+    for chunk in content.chunks():
+        digest.update(chunk)
+    digest = digest.hexdigest()
+    directory, basename = posixpath.split(name)
+    extension = posixpath.splitext(basename)[1].lower()
+    return posixpath.join(directory, digest[:2], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage с именами по SHA-256 и без повторной записи."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, "chunks"):
+            content = File(content, name)
+        name = get_content_name(name, content)
+        validate_file_name(name, allow_relative_path=True)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        """Файл с тем же именем по хешу имеет то же содержимое
+        и заменяется, а не сохраняется под другим именем."""
+        if is_content_addressed(name):
+            return name
+        return super().get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        temporary = super()._save(f"{name}.{uuid.uuid4().hex}.tmp", content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
+
+    def delete(self, name):
+        """Файл может использоваться другими записями и не удаляется."""
+
+    def purge(self, name):
+        """Удаляет файл. Вызывается только сборщиком мусора."""
+        super().delete(name)
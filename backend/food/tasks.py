@@ -0,0 +1,24 @@
+"""Периодические задачи обслуживания, которые запускает run_workers."""
+
+from django.conf import settings
+from django.core.management import call_command
+
+from food import follower_counters, jobs, recipe_counters
+
+
+@jobs.task(priority=-10, every=settings.JOB_RECONCILE_COUNTERS_INTERVAL)
+def reconcile_recipe_counters():
+    """Сверяет счётчики избранного и корзин рецептов."""
+    recipe_counters.reconcile()
+
+
+@jobs.task(priority=-10, every=settings.JOB_RECONCILE_COUNTERS_INTERVAL)
+def reconcile_follower_counters():
+    """Сверяет счётчики подписчиков авторов."""
+    follower_counters.reconcile()
+
+
+@jobs.task(priority=-10, every=settings.JOB_GC_MEDIA_INTERVAL)
+def collect_media():
+    """Удаляет медиафайлы, на которые не ссылается база."""
+    call_command("gc_media")
@@ -0,0 +1,88 @@
+"""Проверки ленты подписок, счётчика подписчиков и списка покупок."""
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from food import feed, follower_counters, shopping_list
+from food.models import (FeedEntry, Follow, Ingredient, Recipe,
+                         RecipeIngredient, ShoppingCart, ShoppingListItem)
+
+User = get_user_model()
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=False)
+class FeedTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author = User.objects.bulk_create(
+            User(email=f"feed-{name}@example.com", username=f"feed-{name}")
+            for name in ("user", "author"))
+        Recipe.objects.create(
+            author=cls.author, name="Суп", text="Суп", cooking_time=5)
+
+    def test_add_author_after_unfollow(self):
+        """Задача из очереди не добавляет автора, от которого уже
+        отписались."""
+        Follow.objects.create(user=self.user, following=self.author).delete()
+        feed.add_author(self.user.id, self.author.id)
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def test_add_author(self):
+        Follow.objects.create(user=self.user, following=self.author)
+        feed.add_author(self.user.id, self.author.id)
+        self.assertEqual(FeedEntry.objects.filter(user=self.user).count(), 1)
+
+    def test_followers_count(self):
+        follow = Follow.objects.create(user=self.user, following=self.author)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        follow.delete()
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+        Follow.objects.bulk_create([
+            Follow(user=self.user, following=self.author)])
+        self.assertEqual(follower_counters.reconcile(), 1)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+
+
+class ShoppingListTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email="list@example.com", username="list")
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name="Каша", text="Каша", cooking_time=5)
+        cls.ingredient = Ingredient.objects.create(
+            name="крупа", measurement_unit="г")
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.ingredient, amount=100)
+
+    def get_amounts(self):
+        return dict(
+            ShoppingListItem.objects.filter(user=self.user)
+            .values_list("ingredient_id", "amount"))
+
+    def test_rebuild_matches_cart(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        ShoppingListItem.objects.filter(user=self.user).update(amount=1)
+        self.assertEqual(shopping_list.rebuild(self.user.id), 1)
+        self.assertEqual(self.get_amounts(), {self.ingredient.id: 100})
+
+    def test_rebuild_reads_cart_under_user_lock(self):
+        """Корзина читается после блокировки пользователя, иначе
+        параллельное изменение корзины теряется при пересборке."""
+        with CaptureQueriesContext(connection) as context:
+            shopping_list.rebuild(self.user.id)
+        selects = [
+            query["sql"] for query in context.captured_queries
+            if query["sql"].startswith("SELECT")]
+        self.assertIn(self.user._meta.db_table, selects[0])
+        if connection.features.has_select_for_update:
+            self.assertIn("FOR UPDATE", selects[0])
+        self.assertIn(ShoppingCart._meta.db_table, selects[1])
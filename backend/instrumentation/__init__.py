@@ -0,0 +1,9 @@
+"""Измерение стоимости запросов к API.
+
+InstrumentationMiddleware собирает для каждого запроса имя представления
+и действия, число и время SQL-запросов, время сериализации и размер
+ответа. Итоги накапливаются в метриках процесса (/metrics в формате
+Prometheus) и, если включено, отдаются в заголовке Server-Timing
+и пишутся в лог instrumentation одной JSON-строкой
+(INSTRUMENTATION_LOG_LEVEL=INFO).
+"""
@@ -0,0 +1,162 @@
+"""Метрики процесса в формате Prometheus.
+
+Значения хранятся в памяти процесса, поэтому при нескольких воркерах
+gunicorn каждый отдаёт свои, а Prometheus суммирует их по меткам
+instance. Библиотека prometheus_client для этого не нужна.
+"""
+
+import bisect
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger("instrumentation")
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Сколько разных размеров страницы помнить для каждого эндпоинта.
+MAX_PAGE_SIZES = 32
+
+
+def _format_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(
+            name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for name, value in labels
+    )
+
+
+def render_gauge(name, help_text, samples):
+    """Строки метрики-gauge по парам (метки, значение)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{{{_format_labels(labels)}}} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+class Registry:
+    """Счётчики и гистограммы по наборам меток."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._histograms = {}
+        self._help = {}
+
+    def describe(self, name, kind, help_text):
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            self._counters[name, tuple(labels)] += value
+
+    def observe(self, name, labels, value, buckets=DURATION_BUCKETS):
+        with self._lock:
+            key = name, tuple(labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {
+                    "buckets": buckets,
+                    "counts": [0] * len(buckets),
+                    "sum": 0.0,
+                    "count": 0,
+                }
+            position = bisect.bisect_left(histogram["buckets"], value)
+            if position < len(buckets):
+                histogram["counts"][position] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def render(self):
+        """Текст для /metrics (формат Prometheus 0.0.4)."""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, dict(value, counts=list(value["counts"])))
+                for key, value in self._histograms.items()
+            )
+        lines = []
+        described = set()
+
+        def header(name):
+            if name not in described and name in self._help:
+                kind, help_text = self._help[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                described.add(name)
+
+        for (name, labels), value in counters:
+            header(name)
+            lines.append(f"{name}{{{_format_labels(labels)}}} {value:g}")
+        for (name, labels), histogram in histograms:
+            header(name)
+            cumulative = 0
+            for bound, count in zip(histogram["buckets"], histogram["counts"]):
+                cumulative += count
+                bucket_labels = _format_labels(labels + (("le", bound),))
+                lines.append(f"{name}_bucket{{{bucket_labels}}} {cumulative}")
+            all_labels = _format_labels(labels + (("le", "+Inf"),))
+            lines.append(f"{name}_bucket{{{all_labels}}} {histogram['count']}")
+            lines.append(
+                f"{name}_sum{{{_format_labels(labels)}}} {histogram['sum']:g}")
+            lines.append(
+                f"{name}_count{{{_format_labels(labels)}}} "
+                f"{histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+registry.describe(
+    "http_requests_total", "counter", "Обработанные запросы.")
+registry.describe(
+    "http_request_duration_seconds", "histogram", "Время обработки запроса.")
+registry.describe(
+    "http_request_sql_queries_total", "counter", "SQL-запросы.")
+registry.describe(
+    "http_request_sql_duration_seconds_total", "counter",
+    "Время выполнения SQL-запросов.")
+registry.describe(
+    "http_request_serializer_duration_seconds_total", "counter",
+    "Время сериализации ответов.")
+registry.describe(
+    "http_response_size_bytes_total", "counter", "Размер тел ответов.")
+registry.describe(
+    "http_query_growth_alerts_total", "counter",
+    "Ответы, в которых число SQL-запросов росло с размером страницы.")
+
+
+class QueryGrowthDetector:
+    """Замечает эндпоинты, где число запросов растёт с размером страницы.
+
+    Для каждого эндпоинта помнит наименьшее число запросов при каждом
+    размере страницы. Если от самой маленькой страницы к текущей запросов
+    на элемент прибавляется не меньше INSTRUMENTATION_QUERY_GROWTH_THRESHOLD,
+    это похоже на N+1.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._observations = defaultdict(dict)
+
+    def observe(self, endpoint, items, queries):
+        """Запоминает ответ и возвращает прирост запросов на элемент,
+        если он превысил порог, иначе None."""
+        threshold = settings.INSTRUMENTATION_QUERY_GROWTH_THRESHOLD
+        with self._lock:
+            seen = self._observations[endpoint]
+            if items in seen or len(seen) < MAX_PAGE_SIZES:
+                seen[items] = min(queries, seen.get(items, queries))
+            smallest = min(seen)
+            if smallest >= items:
+                return None
+            # Наименьшие значения не зависят от разовых промахов кеша.
+            growth = (seen.get(items, queries) - seen[smallest]) / (
+                items - smallest)
+        if threshold and growth >= threshold:
+            return growth
+        return None
+
+
+query_growth = QueryGrowthDetector()
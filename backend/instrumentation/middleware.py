@@ -0,0 +1,202 @@
+"""Middleware, собирающее показатели каждого запроса."""
+
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from instrumentation.metrics import query_growth, registry
+from instrumentation.stats import (RequestStats, activate, deactivate,
+                                   get_current)
+
+logger = logging.getLogger("instrumentation")
+
+
+def get_endpoint(request, response):
+    """Имя маршрута и действия DRF, например ("recipes-list", "list").
+    Асинхронные представления api.async_views указывают действие
+    в атрибуте ответа action."""
+    match = request.resolver_match
+    view_name = match.view_name if match is not None else "unmatched"
+    renderer_context = getattr(response, "renderer_context", None) or {}
+    action = (getattr(renderer_context.get("view"), "action", None)
+              or getattr(response, "action", None) or "")
+    return view_name, action
+
+
+def get_item_count(response):
+    """Число элементов в ответе-списке или None для других ответов."""
+    data = getattr(response, "data", None)
+    if isinstance(data, dict):
+        data = data.get("results")
+    if isinstance(data, list):
+        return len(data)
+    return None
+
+
+def count_query(execute, sql, params, many, context):
+    """Обёртка соединения: учитывает запрос в показателях текущего
+    запроса. Показатели берутся из contextvar, поэтому запросы
+    асинхронных представлений, выполненные в потоках sync_to_async,
+    тоже попадают в свой запрос."""
+    stats = get_current()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.execute_wrapper(execute, sql, params, many, context)
+
+
+def install_query_counter(connection):
+    # В начало списка: connection.execute_wrapper() снимает последнюю
+    # обёртку, и установка внутри него не должна её подменить.
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, count_query)
+
+
+@receiver(connection_created)
+def track_new_connection(sender, connection, **kwargs):
+    install_query_counter(connection)
+
+
+class InstrumentationMiddleware:
+    """Считает SQL-запросы и время каждого запроса.
+
+    Для потоковых ответов запросы, выполненные при отдаче тела, тоже
+    учитываются: итоги подводятся, когда тело отдано целиком, но
+    в Server-Timing они уже не попадают.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        # Соединения, открытые до загрузки middleware.
+        for connection in connections.all():
+            install_query_counter(connection)
+        stats = RequestStats()
+        token = activate(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            deactivate(token)
+        return self.process(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = activate(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            deactivate(token)
+        return self.process(request, response, stats)
+
+    def process(self, request, response, stats):
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self.astream(
+                    request, response, stats, response.streaming_content)
+            else:
+                response.streaming_content = self.stream(
+                    request, response, stats, response.streaming_content)
+        else:
+            self.finish(request, response, stats, len(response.content))
+            if settings.INSTRUMENTATION_SERVER_TIMING:
+                response["Server-Timing"] = self.get_server_timing(stats)
+        return response
+
+    def stream(self, request, response, stats, content):
+        size = 0
+        token = activate(stats)
+        try:
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            deactivate(token)
+            self.finish(request, response, stats, size)
+
+    async def astream(self, request, response, stats, content):
+        size = 0
+        token = activate(stats)
+        try:
+            async for chunk in content:
+                size += len(chunk)
+                yield chunk
+        finally:
+            deactivate(token)
+            self.finish(request, response, stats, size)
+
+    def get_server_timing(self, stats):
+        return (
+            f'db;dur={stats.sql_time * 1000:.1f};'
+            f'desc="{stats.queries} queries", '
+            f'serializer;dur={stats.serializer_time * 1000:.1f}, '
+            f'total;dur={stats.duration * 1000:.1f}'
+        )
+
+    def finish(self, request, response, stats, size):
+        duration = stats.duration
+        view_name, action = get_endpoint(request, response)
+        labels = (
+            ("view", view_name), ("action", action),
+            ("method", request.method),
+        )
+        registry.inc(
+            "http_requests_total",
+            labels + (("status", response.status_code),))
+        registry.observe("http_request_duration_seconds", labels, duration)
+        registry.inc("http_request_sql_queries_total", labels, stats.queries)
+        registry.inc(
+            "http_request_sql_duration_seconds_total", labels,
+            stats.sql_time)
+        registry.inc(
+            "http_request_serializer_duration_seconds_total", labels,
+            stats.serializer_time)
+        registry.inc("http_response_size_bytes_total", labels, size)
+
+        items = get_item_count(response)
+        # Для пустой страницы не выполняются запросы связанных объектов,
+        # и сравнение с ней ложно показывает рост.
+        if (items and request.method == "GET" and not stats.cached):
+            # Анонимам и авторизованным нужно разное число запросов.
+            user = getattr(request, "user", None)
+            endpoint = (
+                view_name, action,
+                bool(user is not None and user.is_authenticated))
+            growth = query_growth.observe(endpoint, items, stats.queries)
+            if growth is not None:
+                registry.inc(
+                    "http_query_growth_alerts_total", labels[:2])
+                logger.warning(
+                    "Число SQL-запросов растёт с размером страницы: "
+                    "%s %s, +%.2f запроса на элемент (%d элементов, "
+                    "%d запросов)",
+                    view_name, action, growth, items, stats.queries)
+
+        # Строка на каждый запрос включается INSTRUMENTATION_LOG_LEVEL=INFO.
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                "method": request.method,
+                "path": request.path,
+                "view": view_name,
+                "action": action,
+                "status": response.status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "sql_queries": stats.queries,
+                "sql_ms": round(stats.sql_time * 1000, 2),
+                "serializer_ms": round(stats.serializer_time * 1000, 2),
+                "response_bytes": size,
+                "items": items,
+                "cached": stats.cached,
+            }))
@@ -0,0 +1,26 @@
+"""Учёт времени сериализации в показателях запроса."""
+
+import time
+
+from instrumentation.stats import get_current
+
+
+class TimedSerializerMixin:
+    """Добавляет время to_representation к показателям запроса.
+
+    Вложенные сериализаторы и элементы many=True вызываются внутри
+    внешнего to_representation и отдельно не считаются. SQL-запросы,
+    выполненные при сериализации, входят и во время SQL.
+    """
+
+    def to_representation(self, instance):
+        stats = get_current()
+        if stats is None or stats.serializer_depth:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.serializer_depth -= 1
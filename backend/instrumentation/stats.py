@@ -0,0 +1,45 @@
+"""Показатели текущего запроса."""
+
+import time
+from contextvars import ContextVar
+
+_current = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    """Счётчики одного запроса, заполняемые по ходу его обработки."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        # Ответ взят из кеша и не говорит о числе запросов эндпоинта.
+        self.cached = False
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - started
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.started
+
+
+def get_current():
+    """Показатели обрабатываемого запроса или None вне запроса."""
+    return _current.get()
+
+
+def activate(stats):
+    return _current.set(stats)
+
+
+def deactivate(token):
+    _current.reset(token)
@@ -0,0 +1,38 @@
+"""Проверки доступа к /metrics."""
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+User = get_user_model()
+
+
+@override_settings(METRICS_TOKEN="metrics-token")
+class MetricsAccessTest(TestCase):
+
+    def test_anonymous_is_forbidden(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    def test_wrong_token_is_forbidden(self):
+        response = self.client.get(
+            "/metrics", HTTP_AUTHORIZATION="Bearer wrong-token")
+        self.assertEqual(response.status_code, 403)
+
+    def test_token(self):
+        response = self.client.get(
+            "/metrics", HTTP_AUTHORIZATION="Bearer metrics-token")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"jobs", response.content)
+
+    def test_staff(self):
+        user = User.objects.create(
+            email="staff@example.com", username="staff", is_staff=True)
+        self.client.force_login(user)
+        self.assertEqual(self.client.get("/metrics").status_code, 200)
+        user.is_staff = False
+        user.save()
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+
+    @override_settings(METRICS_TOKEN="")
+    def test_empty_token_is_not_accepted(self):
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer ")
+        self.assertEqual(response.status_code, 403)
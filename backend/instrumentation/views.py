@@ -0,0 +1,55 @@
+import hmac
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from food import jobs
+from instrumentation.metrics import registry, render_gauge
+
+
+def render_job_metrics():
+    """Состояние очереди фоновых задач. Значения читаются из базы,
+    поэтому общие для всех процессов."""
+    stats = jobs.get_stats()
+    return (
+        render_gauge(
+            "jobs", "Фоновые задачи по состоянию.",
+            [((("name", row["name"]), ("status", row["status"])),
+              row["total"]) for row in stats["jobs"]])
+        + render_gauge(
+            "jobs_duration_seconds", "Суммарное время выполнения задач.",
+            [((("name", row["name"]), ("status", row["status"])),
+              row["duration"]) for row in stats["jobs"]])
+        + render_gauge(
+            "jobs_retrying", "Задачи, ждущие повторной попытки.",
+            [((), stats["retrying"])])
+        + render_gauge(
+            "jobs_oldest_queued_age_seconds",
+            "Сколько ждёт самая старая готовая к выполнению задача.",
+            [((), stats["oldest_queued_seconds"])])
+    )
+
+
+def has_metrics_access(request):
+    """Метрики доступны по токену из METRICS_TOKEN (заголовок
+    Authorization: Bearer <токен>, как bearer_token у Prometheus)
+    и сотрудникам, вошедшим в админку."""
+    token = settings.METRICS_TOKEN
+    if token:
+        scheme, _, credentials = request.headers.get(
+            "Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and hmac.compare_digest(
+                credentials.strip().encode(), token.encode()):
+            return True
+    user = getattr(request, "user", None)
+    return bool(user and user.is_active and user.is_staff)
+
+
+def metrics(request):
+    """Метрики процесса и очереди задач для Prometheus."""
+    if not has_metrics_access(request):
+        return HttpResponseForbidden()
+    return HttpResponse(
+        registry.render() + render_job_metrics(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )